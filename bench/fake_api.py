@@ -0,0 +1,173 @@
+import re, json, time, random, hashlib, threading, urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SETS = ["Evolving Skies", "Fusion Strike", "Lost Origin", "Silver Tempest", "Team Up"]
+BENCH_CARDS = 2000  # Benchcard0000…1999; la carta i está en SETS[i % 5] con número i + 1
+
+def set_id(set_name: str) -> str:
+    return set_name.lower().replace(" ", "")
+
+def _seed(*parts) -> int:
+    return int(hashlib.md5("|".join(map(str, parts)).encode()).hexdigest()[:8], 16)
+
+def bench_card(i: int) -> dict:
+    return fake_card(f"{set_id(SETS[i % len(SETS)])}-{i + 1}", f"Benchcard{i:04d}", SETS[i % len(SETS)], str(i + 1))
+
+def fake_card(card_id: str, name: str, set_name: str, number: str = None) -> dict:
+    """Carta con la forma de /v2/cards; el precio es un paseo aleatorio estable por hora."""
+    base = 5 + _seed(card_id) % 200
+    hour = int(time.time() // 3600)
+    rnd = random.Random(_seed(card_id, hour))
+    market = round(base * (1 + rnd.uniform(-0.08, 0.12)), 2)
+    return {"id": card_id, "name": name, "number": number or str(_seed(card_id) % 200 + 1),
+            "rarity": "Rare Secret", "set": {"id": set_id(set_name), "name": set_name},
+            "tcgplayer": {"prices": {"holofoil": {"low": round(market * 0.8, 2), "mid": round(market * 1.05, 2),
+                                                  "market": market, "high": round(market * 1.6, 2)}}},
+            "cardmarket": {"prices": {"avg1": round(market * 1.02, 2), "avg7": market, "avg30": round(market * 0.97, 2),
+                                      "trendPrice": round(market * 1.01, 2)}},
+            "images": {"small": f"https://images.example/{card_id}.png",
+                       "large": f"https://images.example/{card_id}_hires.png"},
+            # Relleno con el peso típico de una carta real; `select` lo deja fuera.
+            "attacks": [{"name": f"Attack {k}", "cost": ["Colorless"] * 3, "convertedEnergyCost": 3,
+                         "damage": "120", "text": "Lorem ipsum dolor sit amet. " * 6} for k in range(2)],
+            "abilities": [{"name": "Ability", "text": "Consectetur adipiscing elit. " * 5, "type": "Ability"}],
+            "rules": ["VMAX rule: When your Pokémon VMAX is Knocked Out, your opponent takes 3 Prize cards."],
+            "legalities": {"unlimited": "Legal", "standard": "Legal", "expanded": "Legal"}}
+
+class FakeAPI:
+    """Servidor local que imita /v2/cards y /v2/sets de PokémonTCG y sendMessage/sendPhoto de Telegram.
+
+    - `latency`: segundos de espera por petición (más un jitter uniforme de ±50%).
+    - `p_soft404`, `p_429`, `p_timeout`, `p_html`: probabilidad de 404 "suave", 429 con
+      Retry-After, de no responder hasta pasados `timeout_sec` segundos y de un 200 con una
+      página HTML en vez de JSON (mantenimiento del edge).
+    Cuenta peticiones por ruta y código en `counts` (ver `snapshot`/`reset`).
+    """
+    def __init__(self, latency=0.02, p_soft404=0.0, p_429=0.0, p_timeout=0.0, timeout_sec=3.0, p_html=0.0, seed=1):
+        self.latency, self.p_soft404, self.p_429, self.p_timeout = latency, p_soft404, p_429, p_timeout
+        self.p_html = p_html
+        self.timeout_sec = timeout_sec
+        self.rnd = random.Random(seed)
+        self.counts = {}
+        self._lock = threading.Lock()
+        self.server = None
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(sorted(self.counts.items()))
+
+    def reset(self):
+        with self._lock:
+            self.counts = {}
+
+    def _fault(self):
+        with self._lock:
+            x = self.rnd.random()
+        if x < self.p_timeout:
+            return "timeout"
+        if x < self.p_timeout + self.p_429:
+            return "429"
+        if x < self.p_timeout + self.p_429 + self.p_soft404:
+            return "404"
+        if x < self.p_timeout + self.p_429 + self.p_soft404 + self.p_html:
+            return "html"
+        return None
+
+    def _sleep(self):
+        if self.latency:
+            with self._lock:
+                jitter = self.rnd.uniform(0.5, 1.5)
+            time.sleep(self.latency * jitter)
+
+    def cards(self, q: str) -> list:
+        by_set = re.search(r'set\.id:"([^"]+)"', q)
+        if by_set:
+            # Listado del índice de sets o query exacta set.id + número(s).
+            numbers = set(re.findall(r'number:"([^"]+)"', q))
+            name = re.search(r'(?<![.\w])name:"?(\w+)', q)
+            return [bench_card(i) for i in range(BENCH_CARDS) if set_id(SETS[i % len(SETS)]) == by_set.group(1)
+                    and (not numbers or str(i + 1) in numbers)
+                    and (not name or f"Benchcard{i:04d}".startswith(name.group(1)))]
+        ids = re.findall(r'(?<![.\w])id:"([^"]+)"', q)
+        if ids:
+            return [bench_card(int(i.rsplit("-", 1)[1]) - 1) if "-" in i
+                    else fake_card(i, i.split(":")[0], SETS[_seed(i) % len(SETS)]) for i in ids]
+        name = (re.search(r'name:"?([\w&\'-]+)', q) or re.search(r"(\w+)", q) or [None, "x"])[1].rstrip("*")
+        set_m = re.search(r'set\.name:"([^"]+)"', q)
+        set_name = set_m.group(1) if set_m else SETS[_seed(name) % len(SETS)]
+        return [fake_card(f"{name}:{k}", name, set_name) for k in ("a", "b")]
+
+    def start(self, port: int = 0):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *a):
+                pass
+
+            def _send(self, code, body, headers=None):
+                raw = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "text/html" if isinstance(body, str) else "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_GET(self):
+                u = urllib.parse.urlparse(self.path)
+                route = u.path.rstrip("/").rsplit("/", 1)[-1]
+                api._sleep()
+                fault = api._fault()
+                api._count(f"GET /{route} {fault or 200}")
+                if fault == "timeout":
+                    time.sleep(api.timeout_sec)
+                    return self._send(504, {"error": "timeout"})
+                if fault == "429":
+                    return self._send(429, {"error": "rate limited"}, {"Retry-After": "1"})
+                if fault == "404":
+                    return self._send(404, {"error": "not found"})
+                if fault == "html":
+                    return self._send(200, "<html><body>Down for maintenance</body></html>")
+                qs = urllib.parse.parse_qs(u.query)
+                if route == "sets":
+                    data = [{"id": set_id(s), "name": s, "series": "Bench", "ptcgoCode": None,
+                             "printedTotal": BENCH_CARDS, "total": BENCH_CARDS, "releaseDate": "2021/01/01"}
+                            for s in SETS]
+                else:
+                    data = api.cards(qs.get("q", [""])[0])
+                page_size = int(qs.get("pageSize", ["250"])[0])
+                page = int(qs.get("page", ["1"])[0])
+                chunk = data[(page - 1) * page_size: page * page_size]
+                if qs.get("select"):
+                    fields = qs["select"][0].split(",")
+                    chunk = [{k: c[k] for k in fields if k in c} for c in chunk]
+                self._send(200, {"data": chunk, "page": page, "pageSize": page_size,
+                                 "count": len(chunk), "totalCount": len(data)})
+
+            def do_POST(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(n)
+                method = self.path.rsplit("/", 1)[-1]
+                api._count(f"POST /{method} 200")
+                self._send(200, {"ok": True, "result": {"message_id": 1}})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-api", daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
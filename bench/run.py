@@ -0,0 +1,202 @@
+"""Benchmark offline del bot: python -m bench.run [--sizes 20,200,2000] [--years 2]
+
+Levanta bench.fake_api, genera un watchlist sintético con años de historial por tamaño y
+mide, cada fase en un proceso aparte (para que el pico de RSS sea suyo):
+
+- run_cold: primera corrida (sin caches, estado de señales y rollups desde cero)
+- run_warm: segunda corrida con los caches ya poblados
+- panel_cold: build_panel() tras borrar panel_state.json y docs/rollups
+- panel_noop: build_panel() sin cambios
+
+Resultados en JSON (por defecto bench/results/<commit>.json); `--compare a.json b.json`
+muestra las diferencias entre dos commits.
+"""
+import os, sys, json, time, shutil, random, argparse, tempfile, subprocess, datetime as dt
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+PHASES = ("run_cold", "run_warm", "panel_cold", "panel_noop")
+
+def _git_sha() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def card_name(i: int) -> str:
+    from bench.fake_api import SETS
+    return f"Benchcard{i:04d} ({SETS[i % len(SETS)]})"
+
+def make_workdir(root: str, n_cards: int, years: float, per_day: int, backend: str, seed: int = 7) -> str:
+    """data/, docs/ y config.yaml con `n_cards` cartas y `years` años de historial sintético."""
+    import yaml
+    from src.utils import slugify
+    from bench.fake_api import SETS
+    work = os.path.join(root, f"cards-{n_cards}")
+    os.makedirs(os.path.join(work, "data")); os.makedirs(os.path.join(work, "docs"))
+    with open(os.path.join(ROOT, "config.yaml"), "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    cfg["watchlist"] = [{"name": card_name(i), "min_grade": "raw", "language": "en",
+                         "queries": [f"Pokemon Benchcard{i:04d} alternate art {SETS[i % len(SETS)]}"]}
+                        for i in range(n_cards)]
+    with open(os.path.join(work, "config.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True, sort_keys=False)
+
+    rnd = random.Random(seed)
+    step = dt.timedelta(days=1) / per_day
+    n = int(years * 365 * per_day)
+    end = dt.datetime.utcnow() - dt.timedelta(hours=8)
+    times = [(end - step * (n - 1 - k)).isoformat() for k in range(n)]
+    store = None
+    if backend == "sqlite":
+        from src.store import HistoryStore
+        store = HistoryStore(os.path.join(work, "data", "history.sqlite"))
+    for i in range(n_cards):
+        slug = slugify(card_name(i))
+        p = 5.0 + rnd.random() * 200
+        rows = []
+        for ts in times:
+            p = max(0.5, p * (1 + rnd.gauss(0.0002, 0.02)))
+            rows.append((slug, ts, round(p, 2), round(p, 2), round(p * 1.02, 2), round(p, 2), round(p * 0.98, 2)))
+        if store:
+            store.append_many(rows)
+        else:
+            with open(os.path.join(work, "data", f"{slug}.csv"), "w", encoding="utf-8", newline="") as f:
+                f.write("ts,price_now,market_now\r\n")
+                f.writelines(f"{ts},{pn},{mn}\r\n" for _, ts, pn, mn, *_ in rows)
+    if store:
+        store.close()
+    return work
+
+def child_env(work: str, api_url: str, args) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PK_DATA_DIR": os.path.join(work, "data"), "PK_DOCS_DIR": os.path.join(work, "docs"),
+        "PK_CONFIG": os.path.join(work, "config.yaml"), "HTTP_CACHE_DIR": os.path.join(work, ".cache", "http"),
+        "CONFIG_CACHE_DIR": os.path.join(work, ".cache", "config"),
+        "POKEMONTCG_API_URL": api_url + "/v2", "TELEGRAM_API_URL": api_url,
+        "POKEMONTCG_API_KEY": "bench", "TELEGRAM_BOT_TOKEN": "bench", "TELEGRAM_CHAT_ID": "1",
+        "POKEMONTCG_RATE": str(args.rate), "POKEMONTCG_BURST": str(max(1, int(args.rate))),
+        "POKEMONTCG_TIMEOUT": str(args.timeout), "WATCH_CONCURRENCY": str(args.concurrency),
+        "WATCH_BATCH_SIZE": "0", "MAX_RUNTIME_SEC": "0", "ALERT_DRAIN_SEC": str(args.alert_drain),
+        "HISTORY_BACKEND": args.backend, "PYTHONHASHSEED": "0",
+    })
+    env.pop("RUN_PROFILE", None)
+    return env
+
+def run_child(phase: str):
+    """Dentro del proceso hijo: ejecuta la fase y escribe una línea BENCH_RESULT con JSON."""
+    import resource
+    from src import metrics
+    t0 = time.perf_counter()
+    if phase.startswith("run"):
+        from src import run
+        run.main()
+    else:
+        from src import panel
+        if phase == "panel_cold":
+            for p in (os.path.join(panel.DATA_DIR, "panel_state.json"), os.path.join(panel.DOCS_DIR, "rollups")):
+                shutil.rmtree(p) if os.path.isdir(p) else (os.path.exists(p) and os.remove(p))
+        with metrics.timer("panel.build"):
+            panel.build_panel()
+    wall = time.perf_counter() - t0
+    out = {"wall_sec": round(wall, 3),
+           "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+           "stages": {k: {f: t[f] for f in ("count", "total", "p50", "p95")}
+                      for k, t in metrics.snapshot()["timers"].items()},
+           "http_bytes": {k: v for k, v in metrics.snapshot()["counters"].items() if k.endswith(".bytes")},
+           "fetch_errors": {k: v for k, v in metrics.snapshot()["counters"].items()
+                            if k.startswith("fetch.") and k.endswith((".timeout", ".net", ".parse", ".other"))}}
+    status = os.path.join(os.environ["PK_DATA_DIR"], "status.json")
+    if phase.startswith("run") and os.path.exists(status):
+        with open(status, "r", encoding="utf-8") as f:
+            st = json.load(f)
+        out["run"] = {k: st.get(k) for k in ("processed", "timeouts", "net_errors", "parse_errors", "alerts_sent")}
+        out["run"]["telegram"] = st.get("telegram")
+    sys.stdout.write("\nBENCH_RESULT " + json.dumps(out) + "\n")
+
+def run_suite(args) -> dict:
+    from bench.fake_api import FakeAPI
+    api = FakeAPI(latency=args.latency, p_soft404=args.p_soft404, p_429=args.p_429,
+                  p_timeout=args.p_timeout, timeout_sec=args.timeout + 1, p_html=args.p_html).start()
+    root = tempfile.mkdtemp(prefix="pk-bench-")
+    results = {"commit": _git_sha(), "created": dt.datetime.utcnow().isoformat(), "python": sys.version.split()[0],
+               "params": {k: v for k, v in vars(args).items() if k not in ("compare", "out", "child", "keep")},
+               "scenarios": []}
+    try:
+        for n in args.sizes:
+            t0 = time.perf_counter()
+            work = make_workdir(root, n, args.years, args.per_day, args.backend)
+            print(f"[bench] {n} cartas: historial generado en {time.perf_counter() - t0:.1f}s")
+            for phase in PHASES:
+                api.reset()
+                proc = subprocess.run([sys.executable, "-m", "bench.run", "--child", phase], cwd=ROOT,
+                                      env=child_env(work, api.url, args), capture_output=True, text=True)
+                line = next((l for l in proc.stdout.splitlines() if l.startswith("BENCH_RESULT ")), None)
+                if proc.returncode or not line:
+                    print(proc.stdout[-2000:], proc.stderr[-2000:])
+                    raise SystemExit(f"[bench] la fase {phase} con {n} cartas falló (código {proc.returncode})")
+                res = {"cards": n, "phase": phase, **json.loads(line[len("BENCH_RESULT "):])}
+                counts = api.snapshot()
+                res["requests"] = {"total": sum(counts.values()), "by_route": counts}
+                results["scenarios"].append(res)
+                print(f"[bench] {n:>5} cartas {phase:<10} {res['wall_sec']:>8.2f}s  "
+                      f"{res['requests']['total']:>6} peticiones  RSS {res['peak_rss_mb']:.0f} MB")
+    finally:
+        api.stop()
+        if args.keep:
+            print(f"[bench] directorio de trabajo: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+def compare(a_path: str, b_path: str):
+    with open(a_path, "r", encoding="utf-8") as f:
+        a = json.load(f)
+    with open(b_path, "r", encoding="utf-8") as f:
+        b = json.load(f)
+    base = {(s["cards"], s["phase"]): s for s in a["scenarios"]}
+    print(f"{'cartas':>6} {'fase':<10} {'wall':>16} {'peticiones':>16} {'RSS MB':>16}   ({a['commit']} → {b['commit']})")
+    for s in b["scenarios"]:
+        o = base.get((s["cards"], s["phase"]))
+        if not o:
+            continue
+        def d(x, y):
+            return f"{x:.2f}→{y:.2f} {((y - x) / x * 100 if x else 0):+.0f}%"
+        print(f"{s['cards']:>6} {s['phase']:<10} {d(o['wall_sec'], s['wall_sec']):>16} "
+              f"{o['requests']['total']:>7}→{s['requests']['total']:<8} {d(o['peak_rss_mb'], s['peak_rss_mb']):>16}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bench.run", description="Benchmark offline contra una API falsa.")
+    ap.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=[20, 200, 2000])
+    ap.add_argument("--years", type=float, default=2.0, help="años de historial sintético por carta")
+    ap.add_argument("--per-day", type=int, default=3, help="muestras por día en el historial")
+    ap.add_argument("--backend", choices=["sqlite", "csv"], default="sqlite")
+    ap.add_argument("--latency", type=float, default=0.02, help="segundos por petición en la API falsa")
+    ap.add_argument("--p-soft404", type=float, default=0.02)
+    ap.add_argument("--p-429", type=float, default=0.01)
+    ap.add_argument("--p-timeout", type=float, default=0.0)
+    ap.add_argument("--p-html", type=float, default=0.0, help="200 con HTML en vez de JSON")
+    ap.add_argument("--timeout", type=float, default=2.0, help="POKEMONTCG_TIMEOUT del bot")
+    ap.add_argument("--rate", type=float, default=50.0, help="POKEMONTCG_RATE del bot (req/s)")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--alert-drain", type=float, default=5.0, help="ALERT_DRAIN_SEC del bot")
+    ap.add_argument("--out", help="JSON de resultados (por defecto bench/results/<commit>.json)")
+    ap.add_argument("--keep", action="store_true", help="no borra el directorio de trabajo")
+    ap.add_argument("--compare", nargs=2, metavar=("BASE", "NUEVO"))
+    ap.add_argument("--child", choices=PHASES, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    if args.child:
+        return run_child(args.child)
+    if args.compare:
+        return compare(*args.compare)
+    results = run_suite(args)
+    out = args.out or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    print(f"[bench] resultados en {out}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,4 @@
+import sys
+from .cli import main
+
+main(sys.argv[1:])
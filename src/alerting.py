@@ -1,25 +1,220 @@
-import os, requests
-def send_telegram_text(token_env: str, chat_env: str, text: str):
-    token = os.getenv(token_env) if token_env else None
-    chat_id = os.getenv(chat_env) if chat_env else None
-    if not token or not chat_id:
-        return
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    try:
-        requests.post(url, data={"chat_id": chat_id, "text": text, "parse_mode": "HTML"}, timeout=15)
-    except Exception as e:
-        print("Telegram text alert error:", e)
-def send_telegram_photo(token_env: str, chat_env: str, photo_url: str, caption: str = None):
-    token = os.getenv(token_env) if token_env else None
-    chat_id = os.getenv(chat_env) if chat_env else None
-    if not token or not chat_id or not photo_url:
-        return
-    url = f"https://api.telegram.org/bot{token}/sendPhoto"
-    data = {"chat_id": chat_id, "photo": photo_url}
-    if caption:
-        data["caption"] = caption
-        data["parse_mode"] = "HTML"
-    try:
-        requests.post(url, data=data, timeout=20)
-    except Exception as e:
-        print("Telegram photo alert error:", e)
+import os, json, threading, collections, datetime as dt
+import requests
+from requests.adapters import HTTPAdapter
+from .ratelimit import TokenBucket
+from .metrics import incr, timer, record_http, classify_error
+
+TELEGRAM_API = "https://api.telegram.org"
+CAPTION_LIMIT = 1024
+OUTBOX_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "outbox.jsonl")
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+def _session():
+    """Sesión HTTP compartida (keep-alive) para todas las llamadas a Telegram."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            s = requests.Session()
+            s.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+            _SESSION = s
+        return _SESSION
+
+def _post(token: str, method: str, data: dict, timeout: float = 15):
+    return _session().post(f"{os.getenv('TELEGRAM_API_URL', TELEGRAM_API)}/bot{token}/{method}",
+                           data=data, timeout=timeout)
+
+def spike_message(name: str, meta: dict, price_now: float, source: str = None, queries=()) -> tuple:
+    """(título, cuerpo) de una alerta de spike; lo comparten la corrida y `python -m src alert`."""
+    title = f"📈 Spike: {name}"
+    body = (f"Δ24h: {meta['pct_24h']*100:.1f}% | Δ7d: {meta['pct_7d']*100:.1f}% | breakout: {meta['breakout']}\n"
+            f"Ahora: ${price_now:.2f} ({source or 'PokémonTCG/CM'})")
+    if queries:
+        body += f"\nQueries: {', '.join(queries)}"
+    return title, body
+
+def build_alert(token_env: str, chat_env: str, title: str, body: str, image_url: str = None,
+                cooldown: dict = None) -> dict:
+    """Mensaje de alerta listo para el dispatcher: foto + caption en una sola llamada si cabe.
+
+    Sólo guarda los *nombres* de las variables de entorno, nunca el token ni el chat_id,
+    así el outbox puede vivir en data/ sin filtrar secretos. `cooldown` ({"key", "signal"})
+    viaja con el mensaje (también por el outbox) hasta que se confirma el envío.
+    """
+    text = f"<b>{title}</b>\n{body}"
+    if image_url and len(text) <= CAPTION_LIMIT:
+        msg = {"method": "sendPhoto", "data": {"photo": image_url, "caption": text, "parse_mode": "HTML"}}
+    else:
+        msg = {"method": "sendMessage", "data": {"text": text, "parse_mode": "HTML"}}
+    msg.update({"token_env": token_env, "chat_env": chat_env, "created": dt.datetime.utcnow().isoformat()})
+    if cooldown:
+        msg["cooldown"] = cooldown
+    return msg
+
+class TelegramDispatcher:
+    """Envía alertas desde un hilo en segundo plano para no bloquear el loop de cartas.
+
+    - Respeta el límite por chat de Telegram (~1 msg/s; 20/min en grupos) y `retry_after` en 429.
+    - Si una foto es rechazada (400) se reenvía como texto.
+    - Lo que no se pudo entregar (o no dio tiempo a enviar en `close`) queda en el outbox
+      (JSON lines) y se reintenta al arrancar la siguiente corrida.
+    - `on_sent(msg)` se llama desde el hilo del dispatcher por cada mensaje que Telegram acepta.
+    """
+    def __init__(self, outbox_path: str = OUTBOX_FILE, max_attempts: int = 3, max_age_hours: float = 48.0,
+                 on_sent=None):
+        self.outbox_path = outbox_path
+        self.max_attempts = max_attempts
+        self.max_age = dt.timedelta(hours=max_age_hours)
+        self.on_sent = on_sent
+        self.q = collections.deque()
+        self.failed = []
+        self.buckets = {}
+        self.counters = {"queued": 0, "sent": 0, "failed": 0, "retried_from_outbox": 0, "dropped_old": 0, "outbox": 0}
+        self._lock = threading.Lock()
+        self._cv = threading.Condition(self._lock)
+        self._thread = None
+        self._inflight = None
+        self._closing = False
+        self._abandoned = False
+
+    def start(self):
+        for msg in self._load_outbox():
+            self.counters["retried_from_outbox"] += 1
+            self.q.append(msg)
+        self._thread = threading.Thread(target=self._worker, name="telegram-dispatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, msg: dict):
+        with self._cv:
+            self.counters["queued"] += 1
+            self.q.append(msg)
+            self._cv.notify()
+
+    def close(self, timeout: float = 60.0):
+        """Espera a vaciar la cola (hasta `timeout`) y persiste lo pendiente en el outbox."""
+        with self._cv:
+            self._closing = True
+            self._cv.notify()
+        if self._thread:
+            self._thread.join(timeout)
+        with self._lock:
+            # Si el hilo sigue vivo, el mensaje que tiene entre manos (enviándose o esperando
+            # al rate limit) también va al outbox: puede llegar dos veces, nunca perderse.
+            self._abandoned = True
+            pending = list(self.failed)
+            if self._inflight is not None:
+                pending.append(self._inflight)
+            pending.extend(self.q)
+            self.q.clear()
+            self.counters["outbox"] = len(pending)
+        self._save_outbox(pending)
+        return self.stats()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+    def _bucket(self, chat_id: str) -> TokenBucket:
+        if chat_id not in self.buckets:
+            # Grupos/canales (ids negativos) tienen un límite más estricto.
+            rate = 20 / 60 if str(chat_id).startswith("-") else 1.0
+            self.buckets[chat_id] = TokenBucket(rate, burst=1)
+        return self.buckets[chat_id]
+
+    def _worker(self):
+        while True:
+            with self._cv:
+                while not self.q and not self._closing:
+                    self._cv.wait()
+                if self._abandoned or not self.q:
+                    return
+                msg = self._inflight = self.q.popleft()
+            ok = self._deliver(msg)
+            with self._lock:
+                self._inflight = None
+                if self._abandoned:
+                    return  # close() ya lo guardó en el outbox
+                if ok:
+                    self.counters["sent"] += 1
+                elif ok is False:
+                    self.counters["failed"] += 1
+                    self.failed.append(msg)
+            if ok and self.on_sent:
+                try:
+                    self.on_sent(msg)
+                except Exception as e:
+                    print("[telegram] on_sent:", type(e).__name__, str(e)[:200])
+
+    def _deliver(self, msg: dict):
+        token, chat_id = os.getenv(msg.get("token_env") or ""), os.getenv(msg.get("chat_env") or "")
+        if not token or not chat_id:
+            return None  # sin credenciales: no es un fallo reintentable
+        bucket = self._bucket(chat_id)
+        method, data = msg["method"], dict(msg["data"], chat_id=chat_id)
+        for attempt in range(self.max_attempts):
+            bucket.acquire()
+            if attempt:
+                incr("alert.retries")
+            try:
+                with timer("alert.send"):
+                    r = _post(token, method, data, timeout=20)
+            except requests.exceptions.RequestException as e:
+                print("[telegram] error de red:", type(e).__name__, str(e)[:200])
+                incr(f"alert.errors.{classify_error(e)}")
+                bucket.backoff(2.0 ** attempt)
+                continue
+            record_http("telegram", r)
+            if r.status_code == 200:
+                bucket.success()
+                return True
+            if r.status_code == 429:
+                try:
+                    retry = float(r.json().get("parameters", {}).get("retry_after", 1))
+                except ValueError:
+                    retry = 1.0
+                print(f"[telegram] 429, espero {retry:.0f}s")
+                bucket.backoff(retry)
+                continue
+            if r.status_code == 400 and method == "sendPhoto":
+                # URL de imagen rechazada: mandamos el mismo texto sin foto.
+                print("[telegram] foto rechazada, envío sólo texto")
+                method = "sendMessage"
+                data = {"chat_id": chat_id, "text": data.get("caption", ""), "parse_mode": "HTML"}
+                msg["method"], msg["data"] = method, {k: v for k, v in data.items() if k != "chat_id"}
+                continue
+            if 400 <= r.status_code < 500:
+                print(f"[telegram] {method} rechazado ({r.status_code}): {r.text[:200]}")
+                return None  # error permanente: reintentar no ayuda
+            bucket.backoff(2.0 ** attempt)
+        msg["attempts"] = msg.get("attempts", 0) + 1
+        return False
+
+    def _load_outbox(self) -> list:
+        try:
+            with open(self.outbox_path, "r", encoding="utf-8") as f:
+                lines = [json.loads(l) for l in f if l.strip()]
+        except (OSError, ValueError):
+            return []
+        now, out = dt.datetime.utcnow(), []
+        for msg in lines:
+            try:
+                too_old = now - dt.datetime.fromisoformat(msg["created"]) > self.max_age
+            except (KeyError, ValueError):
+                too_old = True
+            if too_old or msg.get("attempts", 0) >= self.max_attempts * 3:
+                self.counters["dropped_old"] += 1
+            else:
+                out.append(msg)
+        return out
+
+    def _save_outbox(self, pending: list):
+        if not pending:
+            if os.path.exists(self.outbox_path):
+                os.remove(self.outbox_path)
+            return
+        with open(self.outbox_path, "w", encoding="utf-8") as f:
+            for msg in pending:
+                f.write(json.dumps(msg, ensure_ascii=False) + "\n")
+        print(f"[telegram] {len(pending)} alertas pendientes guardadas en el outbox")
@@ -0,0 +1,246 @@
+import os, sys, csv, glob, json, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .store import HistoryStore, use_sqlite
+from .utils import iso_to_epoch
+from .config import load_config
+from .signals import cm_filter
+
+DATA_DIR = os.getenv("PK_DATA_DIR") or os.path.join(os.path.dirname(__file__), "..", "data")
+CONFIG_FILE = os.getenv("PK_CONFIG") or os.path.join(os.path.dirname(__file__), "..", "config.yaml")
+DAY = 86400.0
+
+def load_history(data_dir: str = DATA_DIR) -> dict:
+    """Todo el historial una sola vez: {slug: {"ts", "price", "avg1", "avg7", "avg30"}} en arrays.
+
+    Usa data/history.sqlite si existe; si no, los data/*.csv (sin columnas Cardmarket → NaN).
+    """
+    raw = {}
+    db_file = os.path.join(data_dir, "history.sqlite")
+    if use_sqlite() and os.path.exists(db_file):
+        store = HistoryStore(db_file)
+        for card, ts, p, a1, a7, a30 in store.iter_all():
+            raw.setdefault(card, []).append((iso_to_epoch(ts), p or 0.0, a1, a7, a30))
+        store.close()
+    else:
+        for path in sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+            card = os.path.splitext(os.path.basename(path))[0]
+            with open(path, "r", encoding="utf-8") as f:
+                for r in csv.DictReader(f):
+                    try:
+                        raw.setdefault(card, []).append((iso_to_epoch(r["ts"]), float(r.get("price_now") or 0),
+                                                         None, None, None))
+                    except (KeyError, ValueError):
+                        pass
+    out = {}
+    for card, rows in raw.items():
+        rows.sort(key=lambda r: r[0])
+        arr = np.array([[np.nan if v is None else v for v in r] for r in rows], dtype=float)
+        out[card] = {"ts": arr[:, 0], "price": arr[:, 1], "avg1": arr[:, 2], "avg7": arr[:, 3], "avg30": arr[:, 4]}
+    return out
+
+def _range_max(px, lo, hi):
+    """max(px[lo:hi]) para muchos rangos a la vez con una sparse table (NaN si el rango es vacío)."""
+    n = px.size
+    out = np.full(lo.shape, np.nan)
+    valid = hi > lo
+    if n == 0 or not valid.any():
+        return out
+    levels = [px]
+    k = 1
+    while (1 << k) <= n:
+        prev = levels[-1]
+        half = 1 << (k - 1)
+        levels.append(np.maximum(prev[:-half], prev[half:]))
+        k += 1
+    length = (hi - lo)[valid]
+    lv = np.floor(np.log2(length)).astype(int)
+    l, h = lo[valid], hi[valid]
+    res = np.empty(length.size)
+    for j in np.unique(lv):
+        m = lv == j
+        res[m] = np.maximum(levels[j][l[m]], levels[j][h[m] - (1 << j)])
+    out[valid] = res
+    return out
+
+def _window_sums(v, lo, hi):
+    """sum(v[lo:hi]) para muchos rangos a la vez con una suma acumulada."""
+    cs = np.concatenate(([0.0], np.cumsum(v)))
+    return cs[hi] - cs[lo]
+
+def card_features(h: dict, breakout_days_list, stats: bool = False) -> dict:
+    """Para cada muestra i (como "ahora"), lo que vería la señal con el historial previo.
+
+    Mismas reglas que signals.score_batch: anclajes 24h/7d por timestamp (o la muestra más
+    antigua), breakout contra el máximo de la ventana de breakout_days anterior a i. Con
+    `stats` también zscore y vol_spike sobre esa ventana (thresholds.zscore_min / vol_spike_min).
+    """
+    ts, px = h["ts"], h["price"]
+    n = ts.size
+    idx = np.arange(n)
+    def pct_vs(seconds):
+        j = np.searchsorted(ts, ts - seconds, side="right") - 1
+        j = np.clip(j, 0, None)
+        base = px[j]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pct = np.where((base > 0) & (idx > 0), (px - base) / base, 0.0)
+        return pct
+    feats = {"pct_24h": pct_vs(DAY), "pct_7d": pct_vs(7 * DAY), "price": px,
+             "trend": cm_filter(h["avg1"], h["avg7"], h["avg30"], True, 0),
+             "has_cm": ~(np.isnan(h["avg1"]) & np.isnan(h["avg7"]) & np.isnan(h["avg30"])),
+             "avg7": np.nan_to_num(h["avg7"], nan=0.0),
+             "breakout": {}, "zscore": {}, "vol_spike": {}}
+    if stats:
+        # Retorno k = px[k]/px[k-1] - 1, sólo si px[k-1] > 0 (como en score_batch).
+        prev = np.concatenate(([0.0], px[:-1]))
+        has_ret = prev > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ret = np.where(has_ret, px / np.where(has_ret, prev, 1.0) - 1.0, 0.0)
+    for bd in breakout_days_list:
+        lo = np.searchsorted(ts, ts - bd * DAY, side="left")
+        mx = _range_max(px, lo, idx)
+        feats["breakout"][bd] = ~np.isnan(mx) & (px > np.nan_to_num(mx, nan=np.inf))
+        if not stats:
+            continue
+        # Media/desviación de px[lo:i] y desviación de los retornos con las dos muestras en la ventana.
+        cnt = (idx - lo).astype(float)
+        s1, s2 = _window_sums(px, lo, idx), _window_sums(px ** 2, lo, idx)
+        rlo = np.minimum(lo + 1, idx)
+        rc = _window_sums(has_ret.astype(float), rlo, idx)
+        r1, r2 = _window_sums(ret, rlo, idx), _window_sums(ret ** 2, rlo, idx)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(cnt > 0, s1 / cnt, px)
+            std = np.sqrt(np.maximum(np.where(cnt > 1, s2 / cnt - mean ** 2, 0.0), 0.0))
+            vol = np.sqrt(np.maximum(np.where(rc > 1, r2 / rc - (r1 / np.where(rc > 0, rc, 1)) ** 2, 0.0), 0.0))
+            feats["zscore"][bd] = np.where(std > 0, (px - mean) / std, 0.0)
+            feats["vol_spike"][bd] = np.where(vol > 0, feats["pct_24h"] / vol, 0.0)
+    return feats
+
+# Estado compartido por los procesos del pool: se envía una vez por worker (initializer).
+_SHARED = {}
+
+def _init_worker(shared):
+    _SHARED.update(shared)
+
+def _eval_group(task):
+    """Todas las combinaciones (pct_24h, pct_7d) de un grupo (breakout_days, min_avg7, trend).
+
+    Los umbrales son monótonos: cada muestra elegible se cuenta en la celda
+    (nº de umbrales 24h que supera, nº de umbrales 7d que supera) de un histograma por carta
+    y una suma acumulada inversa da las alertas de cada par en O(muestras + rejilla).
+    """
+    bd, min_avg7, use_trend, zscore_min, vol_spike_min, th24, th7 = task
+    f = _SHARED
+    ok = f["breakout"][bd] & (f["price"] > 0)
+    if zscore_min is not None:
+        ok &= f["zscore"][bd] >= zscore_min
+    if vol_spike_min is not None:
+        ok &= f["vol_spike"][bd] >= vol_spike_min
+    if use_trend or min_avg7 > 0:
+        # Igual que run: sin datos Cardmarket no pasa el filtro; los que falten cuentan como 0 (cm_filter).
+        cm_ok = f["has_cm"].copy()
+        if use_trend:
+            cm_ok &= f["trend"]
+        if min_avg7 > 0:
+            cm_ok &= f["avg7"] >= min_avg7
+        ok &= cm_ok
+    A, B = len(th24), len(th7)
+    ia = np.searchsorted(th24, f["pct_24h"][ok], side="right")
+    ib = np.searchsorted(th7, f["pct_7d"][ok], side="right")
+    n = f["n_cards"]
+    hist = np.bincount((f["card"][ok] * (A + 1) + ia) * (B + 1) + ib,
+                       minlength=n * (A + 1) * (B + 1)).reshape(n, A + 1, B + 1)
+    # counts[c, x, y] = muestras con ia > x e ib > y
+    cum = hist[:, ::-1, ::-1].cumsum(axis=1).cumsum(axis=2)[:, ::-1, ::-1]
+    return cum[:, 1:, 1:]
+
+def run_backtest(history: dict, grid: dict, workers: int = 0) -> dict:
+    cards = sorted(history)
+    bds = sorted(set(grid["breakout_days"]))
+    zscore_min, vol_spike_min = grid.get("zscore_min"), grid.get("vol_spike_min")
+    per_card = [card_features(history[c], bds, stats=zscore_min is not None or vol_spike_min is not None)
+                for c in cards]
+    shared = {
+        "n_cards": len(cards),
+        "card": np.concatenate([np.full(history[c]["ts"].size, i) for i, c in enumerate(cards)]) if cards else np.empty(0, int),
+    }
+    for k, dtype in (("breakout", bool), ("zscore", float), ("vol_spike", float)):
+        shared[k] = {bd: np.concatenate([f[k][bd] for f in per_card]) if cards else np.empty(0, dtype)
+                     for bd in bds if not cards or bd in per_card[0][k]}
+    for k in ("pct_24h", "pct_7d", "price", "trend", "has_cm", "avg7"):
+        shared[k] = np.concatenate([f[k] for f in per_card]) if cards else np.empty(0)
+
+    th24 = np.array(sorted(set(grid["pct_24h"])), dtype=float)
+    th7 = np.array(sorted(set(grid["pct_7d"])), dtype=float)
+    groups = [(bd, m, t, zscore_min, vol_spike_min, th24, th7)
+              for bd in bds for m in grid["min_avg7"] for t in grid["trend"]]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(groups) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(groups)), initializer=_init_worker,
+                                 initargs=(shared,)) as pool:
+            counts = list(pool.map(_eval_group, groups))
+    else:
+        _init_worker(shared)
+        counts = [_eval_group(g) for g in groups]
+
+    results = []
+    for (bd, min_avg7, use_trend, *_), cnt in zip(groups, counts):
+        for x, pct_24h in enumerate(th24):
+            for y, pct_7d in enumerate(th7):
+                col = cnt[:, x, y]
+                results.append({"pct_24h": float(pct_24h), "pct_7d": float(pct_7d), "breakout_days": bd,
+                                "min_avg7_usd": min_avg7, "use_cardmarket_trend": use_trend,
+                                "alerts": int(col.sum()),
+                                "per_card": {c: int(v) for c, v in zip(cards, col) if v}})
+    return {"cards": len(cards), "samples": int(shared["card"].size), "combinations": len(results),
+            "results": results}
+
+def _floats(s):
+    return [float(x) for x in s.split(",") if x.strip()]
+
+def main(argv=None):
+    cfg = load_config(CONFIG_FILE)
+    th, run_cfg = cfg["thresholds"], cfg.get("run", {})
+    ap = argparse.ArgumentParser(prog="python -m src.backtest",
+                                 description="Re-juega el historial guardado con una rejilla de umbrales.")
+    ap.add_argument("--pct-24h", type=_floats, default=[th["pct_24h"]], help="lista separada por comas")
+    ap.add_argument("--pct-7d", type=_floats, default=[th["pct_7d"]])
+    ap.add_argument("--breakout-days", type=lambda s: [int(x) for x in _floats(s)], default=[th["breakout_days"]])
+    ap.add_argument("--min-avg7", type=_floats, default=[th.get("min_avg7_usd", 0)])
+    ap.add_argument("--trend", choices=["on", "off", "both"],
+                    default="on" if run_cfg.get("use_cardmarket_trend", True) else "off")
+    ap.add_argument("--zscore-min", type=float, default=th.get("zscore_min"),
+                    help="filtro thresholds.zscore_min (por defecto el del config)")
+    ap.add_argument("--vol-spike-min", type=float, default=th.get("vol_spike_min"),
+                    help="filtro thresholds.vol_spike_min (por defecto el del config)")
+    ap.add_argument("--workers", type=int, default=0, help="procesos (0 = núm. de CPUs)")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--json", help="guarda el resultado completo en este archivo")
+    args = ap.parse_args(argv)
+
+    t0 = time.time()
+    history = load_history(DATA_DIR)
+    t_load = time.time() - t0
+    if (args.trend != "off" or any(args.min_avg7)) and not any(np.any(~np.isnan(h["avg7"])) for h in history.values()):
+        print("[backtest] WARN: el historial no tiene columnas Cardmarket; con --trend on o --min-avg7 > 0 "
+              "ninguna muestra pasa el filtro (prueba --trend off --min-avg7 0).")
+    grid = {"pct_24h": args.pct_24h, "pct_7d": args.pct_7d, "breakout_days": args.breakout_days,
+            "min_avg7": args.min_avg7, "trend": {"on": [True], "off": [False], "both": [True, False]}[args.trend],
+            "zscore_min": args.zscore_min, "vol_spike_min": args.vol_spike_min}
+    res = run_backtest(history, grid, workers=args.workers)
+    res["load_sec"], res["total_sec"] = round(t_load, 3), round(time.time() - t0, 3)
+
+    print(f"[backtest] {res['cards']} cartas, {res['samples']} muestras, {res['combinations']} combinaciones "
+          f"en {res['total_sec']:.2f}s (carga {res['load_sec']:.2f}s)")
+    print(f"{'pct_24h':>8} {'pct_7d':>7} {'bdays':>5} {'avg7':>6} {'trend':>5} {'alerts':>7}  top cartas")
+    for r in sorted(res["results"], key=lambda r: (-r["alerts"], r["pct_24h"], r["pct_7d"]))[:args.top]:
+        top = ", ".join(f"{c}={n}" for c, n in sorted(r["per_card"].items(), key=lambda kv: -kv[1])[:3])
+        print(f"{r['pct_24h']:>8.3f} {r['pct_7d']:>7.3f} {r['breakout_days']:>5} {r['min_avg7_usd']:>6.1f} "
+              f"{'on' if r['use_cardmarket_trend'] else 'off':>5} {r['alerts']:>7}  {top}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(res, f, ensure_ascii=False, indent=1)
+    return res
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,96 @@
+import os, json, time
+
+class RunCheckpoint:
+    """Progreso de la corrida en curso (data/checkpoint.jsonl), escrito en modo append.
+
+    La primera línea guarda el lote completo (`order`); cada flush del pipeline añade una
+    línea con las cartas terminadas, sus items de `stats` y los contadores. Los items sólo
+    viven en el archivo (`iter_items` los relee al final), así la memoria no crece con el lote.
+    Si la corrida termina se borra; si la corta el watchdog o el timeout de Actions, la
+    siguiente retoma las cartas pendientes en vez de elegir un lote nuevo.
+    """
+    def __init__(self, path: str, max_age_hours: float = 24.0):
+        self.path = path
+        self.max_age = max_age_hours * 3600
+        self.created, self.order, self.done, self.counters = 0.0, [], [], {}
+        self._f = None
+
+    def _records(self):
+        """Líneas válidas del archivo, parando en una última línea cortada a medias."""
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except OSError:
+            return
+        with f:
+            for l in f:
+                try:
+                    yield l, json.loads(l)
+                except ValueError:
+                    return
+
+    def resume(self) -> bool:
+        """Carga un checkpoint anterior sin terminar. False si no hay (o es demasiado viejo)."""
+        n = 0
+        for _, rec in self._records():
+            if n == 0:
+                if time.time() - rec.get("created", 0) > self.max_age:
+                    return False
+                self.created, self.order = rec["created"], rec.get("order", [])
+            else:
+                self.done.extend(rec.get("done", []))
+                for k, v in rec.get("counters", {}).items():
+                    self.counters[k] = self.counters.get(k, 0) + v
+            n += 1
+        if not n or not self.pending():
+            return False
+        # Se reescribe sin la posible línea cortada antes de seguir añadiendo.
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as out:
+            out.writelines(l if l.endswith("\n") else l + "\n" for l, _ in self._records())
+        os.replace(tmp, self.path)
+        self._open("a")
+        return True
+
+    def pending(self) -> list:
+        done = set(self.done)
+        return [name for name in self.order if name not in done]
+
+    def start(self, order: list):
+        self.created, self.order, self.done, self.counters = time.time(), list(order), [], {}
+        self._write_header()
+
+    def _write_header(self):
+        self._open("w").write(json.dumps({"created": self.created, "order": self.order}, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def mark(self, done: list, items: list, counters: dict):
+        if not done:
+            return
+        self.done.extend(done)
+        for k, v in counters.items():
+            self.counters[k] = self.counters.get(k, 0) + v
+        self._open("a").write(json.dumps({"done": done, "items": items, "counters": counters},
+                                         ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def iter_items(self):
+        """Items de `stats` de todo el lote (también los de la corrida retomada), desde el archivo."""
+        if self._f:
+            self._f.flush()
+        for i, (_, rec) in enumerate(self._records()):
+            if i:
+                yield from rec.get("items", [])
+
+    def _open(self, mode):
+        if self._f is None or mode == "w":
+            if self._f:
+                self._f.close()
+            self._f = open(self.path, mode, encoding="utf-8")
+        return self._f
+
+    def close(self, finished: bool):
+        if self._f:
+            self._f.close()
+            self._f = None
+        if finished and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,120 @@
+"""python -m src <comando>: cada subcomando importa sólo lo que necesita.
+
+  fetch   corrida completa (red, señales, alertas, panel, health); igual que `python -m src.run`
+  score   re-evalúa las señales desde el historial guardado: sin red ni Telegram
+  alert   como score, y envía las alertas que pasen el cooldown (o sólo las lista con --dry-run)
+  panel   regenera docs/index.html, docs/data.csv y los rollups
+  health  re-renderiza docs/health.html desde data/status.json
+"""
+import os, sys, json, argparse
+
+def _cfg(args):
+    from .config import load_config, CONFIG_FILE
+    cfg = load_config(CONFIG_FILE)
+    th = cfg["thresholds"] = dict(cfg["thresholds"])
+    for key, value in (("pct_24h", args.pct_24h), ("pct_7d", args.pct_7d),
+                       ("breakout_days", args.breakout_days), ("min_avg7_usd", args.min_avg7)):
+        if value is not None:
+            th[key] = value
+    if args.trend:
+        cfg["run"] = {**cfg.get("run", {}), "use_cardmarket_trend": args.trend == "on"}
+    return cfg
+
+def _print_table(results, show_all):
+    rows = [r for r in results if show_all or r["would_alert"]]
+    print(f"{'carta':<44} {'ahora':>9} {'Δ24h':>7} {'Δ7d':>7} {'brk':>4} {'cm':>3}  fuente")
+    for r in rows:
+        print(f"{r['name'][:44]:<44} {r['price_now']:>9.2f} {r['pct_24h']*100:>6.1f}% {r['pct_7d']*100:>6.1f}% "
+              f"{'sí' if r['breakout'] else '—':>4} {'ok' if r['cm_ok'] else '—':>3}  {r['source'] or '—'}"
+              f"{'  📣' if r['would_alert'] else ''}")
+    print(f"[score] {sum(r['would_alert'] for r in results)} de {len(results)} cartas alertarían")
+
+def cmd_fetch(args):
+    if args.dry_run:
+        return cmd_score(args)
+    from .run import main_profiled
+    main_profiled()
+
+def cmd_score(args):
+    from .score import evaluate
+    results = evaluate(_cfg(args))
+    _print_table(results, getattr(args, "all", False))
+    if getattr(args, "json", None):
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+    return results
+
+def cmd_alert(args):
+    if args.dry_run:
+        return cmd_score(args)
+    import time
+    from .score import evaluate, DATA_DIR
+    from .cooldown import AlertIndex
+    from .alerting import TelegramDispatcher, build_alert, spike_message
+    cfg = _cfg(args)
+    alert_cfg = cfg.get("alerting", {})
+    index = AlertIndex(os.path.join(DATA_DIR, "alert_state.json"),
+                       cooldown_hours=float(os.getenv("ALERT_COOLDOWN_HOURS", alert_cfg.get("cooldown_hours", 24))),
+                       step=float(alert_cfg.get("escalation_pct", 0.05)))
+    # El dispatcher también reintenta lo que haya quedado en el outbox; el cooldown se anota al confirmarse.
+    dispatcher = TelegramDispatcher(os.path.join(DATA_DIR, "outbox.jsonl"), on_sent=index.delivered).start()
+    sent = 0
+    for r in evaluate(cfg):
+        signal = (r["epoch"], r["price_now"], r["pct_24h"], r["pct_7d"])
+        if not r["would_alert"] or not index.should_alert(r["card"], *signal):
+            continue
+        title, body = spike_message(r["name"], r, r["price_now"], r["source"])
+        dispatcher.submit(build_alert(alert_cfg.get("telegram_bot_token_env", "TELEGRAM_BOT_TOKEN"),
+                                      alert_cfg.get("telegram_chat_id_env", "TELEGRAM_CHAT_ID"), title, body,
+                                      cooldown={"key": r["card"], "signal": signal}))
+        sent += 1
+    telegram = dispatcher.close(timeout=float(os.getenv("ALERT_DRAIN_SEC", "60")))
+    index.save(time.time())
+    print(f"[alert] {sent} alertas encoladas, telegram: {telegram}")
+
+def cmd_panel(args):
+    from .panel import build_panel
+    build_panel()
+
+def cmd_health(args):
+    from .health import write_health, DATA_DIR
+    with open(os.path.join(DATA_DIR, "status.json"), "r", encoding="utf-8") as f:
+        write_health(json.load(f), save_status=False)
+    print("[health] docs/health.html regenerado")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src", description=__doc__.split("\n")[0],
+                                 formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    sub = ap.add_subparsers(dest="command", required=True)
+    signal_args = argparse.ArgumentParser(add_help=False)
+    signal_args.add_argument("--pct-24h", type=float, help="sobreescribe thresholds.pct_24h")
+    signal_args.add_argument("--pct-7d", type=float, help="sobreescribe thresholds.pct_7d")
+    signal_args.add_argument("--breakout-days", type=int, help="sobreescribe thresholds.breakout_days")
+    signal_args.add_argument("--min-avg7", type=float, help="sobreescribe thresholds.min_avg7_usd")
+    signal_args.add_argument("--trend", choices=["on", "off"], help="sobreescribe run.use_cardmarket_trend")
+
+    fetch = sub.add_parser("fetch", parents=[signal_args], help="corrida completa")
+    fetch.add_argument("--dry-run", action="store_true",
+                       help="no descarga ni envía: equivale a `score` (los umbrales sólo se aceptan con --dry-run)")
+    fetch.set_defaults(func=cmd_fetch)
+    p = sub.add_parser("score", parents=[signal_args], help="señales desde el historial, sin red")
+    p.add_argument("--all", action="store_true", help="lista todas las cartas, no sólo las que alertarían")
+    p.add_argument("--json", help="guarda el resultado completo en este archivo")
+    p.set_defaults(func=cmd_score)
+    p = sub.add_parser("alert", parents=[signal_args], help="score + envío de alertas con cooldown")
+    p.add_argument("--dry-run", action="store_true", help="sólo lista lo que se enviaría")
+    p.set_defaults(func=cmd_alert)
+    sub.add_parser("panel", help="regenera el panel").set_defaults(func=cmd_panel)
+    sub.add_parser("health", help="regenera health.html").set_defaults(func=cmd_health)
+
+    args = ap.parse_args(argv)
+    if args.command == "fetch" and not args.dry_run:
+        # La corrida real usa config.yaml tal cual: un umbral ignorado en silencio engaña.
+        given = [f"--{a.replace('_', '-')}" for a in ("pct_24h", "pct_7d", "breakout_days", "min_avg7", "trend")
+                 if getattr(args, a) is not None]
+        if given:
+            fetch.error(f"{', '.join(given)} sólo se aplica con --dry-run; para la corrida real edita config.yaml")
+    args.func(args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,169 @@
+import os, json, time, zlib, hashlib, threading
+from urllib.parse import urlencode
+import requests
+from requests.structures import CaseInsensitiveDict
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", ".cache", "http")
+
+class HttpCache:
+    """Almacén local de respuestas GET (cuerpo comprimido con zlib + metadatos).
+
+    - Dentro de `fresh_sec` la respuesta se sirve sin tocar la red.
+    - Pasado ese tiempo se revalida con If-None-Match / If-Modified-Since; un 304
+      reutiliza el cuerpo guardado.
+    - Si el directorio supera `max_bytes` se borran primero las entradas más viejas.
+    """
+    def __init__(self, path: str, fresh_sec: float = 900.0, max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.fresh_sec = fresh_sec
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counters = {"fresh_hits": 0, "revalidated": 0, "misses": 0, "stored": 0,
+                         "evicted": 0, "bytes_saved": 0}
+        os.makedirs(path, exist_ok=True)
+        self.size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)
+                        if f.endswith((".z", ".json")))
+
+    @staticmethod
+    def key(url: str, params=None) -> str:
+        qs = urlencode(sorted((params or {}).items()))
+        return hashlib.sha1(f"{url}?{qs}".encode("utf-8")).hexdigest()
+
+    def _files(self, key):
+        return os.path.join(self.path, key + ".json"), os.path.join(self.path, key + ".z")
+
+    def lookup(self, url: str, params=None):
+        """Devuelve (meta, key) o (None, key) si no hay entrada legible."""
+        key = self.key(url, params)
+        meta_f, body_f = self._files(key)
+        try:
+            with open(meta_f, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if not os.path.exists(body_f):
+                return None, key
+        except (OSError, ValueError):
+            return None, key
+        return meta, key
+
+    def is_fresh(self, meta) -> bool:
+        return bool(meta) and self.fresh_sec > 0 and (time.time() - meta.get("stored", 0)) < self.fresh_sec
+
+    def conditional_headers(self, meta) -> dict:
+        h = {}
+        if meta and meta.get("etag"):
+            h["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            h["If-Modified-Since"] = meta["last_modified"]
+        return h
+
+    def response(self, key, meta, reason):
+        """Reconstruye un `requests.Response` 200 desde disco (marca `from_cache`).
+
+        Devuelve None si el cuerpo se desalojó después de `lookup` (la entrada se descarta).
+        """
+        try:
+            with open(self._files(key)[1], "rb") as f:
+                body = zlib.decompress(f.read())
+        except FileNotFoundError:
+            self.drop(key)
+            return None
+        r = requests.models.Response()
+        r.status_code = 200
+        r._content = body
+        r.headers = CaseInsensitiveDict(meta.get("headers") or {})
+        r.url = meta.get("url")
+        r.encoding = "utf-8"
+        r.from_cache = reason
+        with self._lock:
+            self.counters["fresh_hits" if reason == "fresh" else "revalidated"] += 1
+            self.counters["bytes_saved"] += len(body)
+        return r
+
+    def touch(self, key, meta):
+        """Tras un 304: la entrada vuelve a estar fresca."""
+        meta["stored"] = time.time()
+        self._write_json(self._files(key)[0], meta)
+
+    def store(self, key, r):
+        if r.status_code != 200 or not r.content:
+            return
+        meta = {
+            "url": r.url,
+            "stored": time.time(),
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "headers": {"Content-Type": r.headers.get("Content-Type", "application/json")},
+        }
+        meta_f, body_f = self._files(key)
+        old = sum(os.path.getsize(p) for p in (meta_f, body_f) if os.path.exists(p))
+        data = zlib.compress(r.content, 6)
+        tmp = body_f + f".{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, body_f)
+        self._write_json(meta_f, meta)
+        with self._lock:
+            self.counters["stored"] += 1
+            self.size += len(data) + os.path.getsize(meta_f) - old
+            over = self.size > self.max_bytes
+        if over:
+            self.evict()
+
+    def drop(self, key):
+        """Borra la entrada (metadatos y cuerpo) si existe."""
+        with self._lock:
+            for p in self._files(key):
+                try:
+                    self.size -= os.path.getsize(p); os.remove(p)
+                except OSError:
+                    pass
+
+    def miss(self):
+        with self._lock:
+            self.counters["misses"] += 1
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for f in os.listdir(self.path):
+                if f.endswith(".json"):
+                    p = os.path.join(self.path, f)
+                    entries.append((os.path.getmtime(p), f[:-5]))
+            entries.sort()
+            target = self.max_bytes * 0.8
+            for _, key in entries:
+                if self.size <= target:
+                    break
+                for p in self._files(key):
+                    try:
+                        self.size -= os.path.getsize(p); os.remove(p)
+                    except OSError:
+                        pass
+                self.counters["evicted"] += 1
+
+    def _write_json(self, path, obj):
+        tmp = path + f".{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f)
+        os.replace(tmp, path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+            out["size_bytes"] = self.size
+            return out
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def get_cache():
+    """Cache de proceso configurado por entorno (HTTP_CACHE=0 lo desactiva)."""
+    global _CACHE
+    if os.getenv("HTTP_CACHE", "true").lower() not in ("1", "true", "yes"):
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = HttpCache(os.getenv("HTTP_CACHE_DIR", CACHE_DIR),
+                               fresh_sec=float(os.getenv("HTTP_CACHE_FRESH_SEC", "900")),
+                               max_bytes=int(float(os.getenv("HTTP_CACHE_MAX_MB", "50")) * 1024 * 1024))
+        return _CACHE
@@ -1,7 +1,12 @@
 import os, re, time, requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-API_URL = "https://api.pokemontcg.io/v2/cards"
+from ..ratelimit import get_limiter, parse_retry_after
+from .resolve_cache import ResolveCache
+from .httpcache import get_cache
+from ..metrics import incr, observe, record_http, classify_error
+API_BASE = os.getenv("POKEMONTCG_API_URL", "https://api.pokemontcg.io/v2")
+API_URL = API_BASE + "/cards"
 # ...
 # No olvides que _session() ya está definido; lo mantenemos igual.
 
@@ -10,51 +15,66 @@ SET_HINTS = [
     "Scarlet & Violet 151", "Scarlet Violet 151", "Team Up",
     "Base Set", "Neo Genesis", "EX Deoxys", "Champion's Path", "Champions Path"
 ]
+# (minúsculas, original) calculado una vez: _extract_set no llama a .lower() por cada hint.
+_SET_HINTS_LC = [(s.lower(), s) for s in SET_HINTS]
 GENERIC_TOKENS = {"pokemon","tcg","card","cards","alternate","alt","art","alternateart",
                   "special","illustration","promo","ex","v","vmax","gx","sv","sv151",
                   "sws","swsh","champion","champions","path","team","up","neo","base","set"}
+_NUMBER_RE = re.compile(r'\b(\d{1,3}/\d{1,3})\b')
+_CLEAN_RE = re.compile(r'[^A-Za-z0-9&/\-\' ]+')
+_CAPITALIZED_RE = re.compile(r'^[A-Z][a-zA-Z0-9\'-]*$')
+_STRUCTURED_RE = re.compile(r'\b(?:name|set\.name|set\.id|number):')
 def _extract_number(qstr):
-    m = re.search(r'\b(\d{1,3}/\d{1,3})\b', qstr)
+    m = _NUMBER_RE.search(qstr)
     return m.group(1) if m else None
 def _extract_set(qstr):
-    for s in SET_HINTS:
-        if s.lower() in qstr.lower():
+    ql = qstr.lower()
+    for low, s in _SET_HINTS_LC:
+        if low in ql:
             return s
     return None
 def _extract_main_name(qstr: str) -> str:
-    cleaned = re.sub(r'[^A-Za-z0-9&/\-\' ]+', ' ', qstr)
-    tokens = [t for t in cleaned.split() if t]
-    filtered = []
-    for t in tokens:
-        tl = t.lower()
-        if tl in GENERIC_TOKENS: 
-            continue
-        if tl == "pokemon": 
-            continue
-        filtered.append(t)
+    tokens = _CLEAN_RE.sub(' ', qstr).split()
+    filtered = [t for t in tokens if t.lower() not in GENERIC_TOKENS]
     for t in filtered:
-        if re.match(r'^[A-Z][a-zA-Z0-9\'-]*$', t):
+        if _CAPITALIZED_RE.match(t):
             return t
     return filtered[0] if filtered else (tokens[0] if tokens else qstr)
-def _build_candidate_queries(user_q: str):
+def _precise_query(match):
+    """`set.id:"…" number:"…"` para lo que resolvió el índice de sets (varios números con OR)."""
+    numbers = match["numbers"]
+    if len(numbers) == 1:
+        return f'set.id:"{match["set_id"]}" number:"{numbers[0]}"'
+    return f'set.id:"{match["set_id"]}" (' + " OR ".join(f'number:"{n}"' for n in numbers) + ")"
+def _build_candidate_queries(user_q: str, index=None, max_cards=2):
     user_q = user_q.strip()
     number = _extract_number(user_q)
     set_name = _extract_set(user_q)
     main = _extract_main_name(user_q)
+    # Con el índice de sets el set sale de /v2/sets (por id) y, si reconoce la carta,
+    # la primera variante es la query exacta por set.id + número.
+    match = index.resolve(user_q, max_cards) if index else None
+    set_clause = f'set.id:"{match["set_id"]}"' if match else (f'set.name:"{set_name}"' if set_name else None)
 
     candidates = []
 
-    # 1) Si tenemos número + set, es la más precisa
-    if number and set_name:
-        candidates.append(f'number:"{number}" set.name:"{set_name}"')
+    # 0) set.id + número resueltos por el índice
+    if match and match["numbers"]:
+        candidates.append(_precise_query(match))
+
+    # 1) Si tenemos número + set, es la más precisa (también si el índice reconoció el set
+    #    pero no la carta: sin esta variante quedaría name+set, con cualquier carta del mismo nombre)
+    if number and set_clause and not (match and match["numbers"]):
+        # Con set.id el número va como lo guarda la API ("215", no "215/203").
+        candidates.append(f'number:"{number.split("/")[0] if match else number}" {set_clause}')
 
     # 2) name+set con comillas
-    if set_name and main:
-        candidates.append(f'name:"{main}" set.name:"{set_name}"')
+    if set_clause and main:
+        candidates.append(f'name:"{main}" {set_clause}')
 
     # 3) name+set SIN comillas (algunos edges responden mejor)
-    if set_name and main:
-        candidates.append(f'name:{main} set.name:"{set_name}"')
+    if set_clause and main:
+        candidates.append(f'name:{main} {set_clause}')
 
     # 4) name wildcard (tolerante a sufix/prefix)
     if main:
@@ -65,7 +85,7 @@ def _build_candidate_queries(user_q: str):
         candidates.append(f'name:"{main}"')
 
     # 6) Query “raw” si ya venía formateada por el usuario
-    if 'name:' in user_q or 'set.name:' in user_q or 'number:' in user_q:
+    if _STRUCTURED_RE.search(user_q):
         candidates.insert(0, user_q)
 
     # dedup + límite
@@ -79,7 +99,8 @@ def _build_candidate_queries(user_q: str):
 def _session():
     total = int(os.getenv("POKEMONTCG_RETRIES", "2"))
     backoff = float(os.getenv("POKEMONTCG_BACKOFF", "1.0"))
-    status_forcelist = [429, 500, 502, 503, 504]
+    # 429 no se reintenta aquí: lo gestiona el rate limiter compartido (ver _get).
+    status_forcelist = [500, 502, 503, 504]
     retry = Retry(total=total, read=total, connect=total, status=total,
                   backoff_factor=backoff, status_forcelist=status_forcelist,
                   allowed_methods=frozenset(["GET"]), raise_on_status=False)
@@ -88,33 +109,180 @@ def _session():
     s.mount("http://", HTTPAdapter(max_retries=retry))
     return s
 
-def fetch_card_entries(queries, api_key=None, max_cards=2):
+def _limiter(api_key=None):
+    """Limitador de proceso para la API. Por defecto: ~30 req/min sin key, 2 req/s con key.
+
+    POKEMONTCG_RATE/POKEMONTCG_BURST lo fijan explícitamente; si sólo existe el antiguo
+    POKEMONTCG_THROTTLE se respeta como 1/throttle.
+    """
+    rate = os.getenv("POKEMONTCG_RATE")
+    throttle = os.getenv("POKEMONTCG_THROTTLE")
+    if rate:
+        rate = float(rate)
+    elif throttle and float(throttle) > 0:
+        rate = 1.0 / float(throttle)
+    else:
+        rate = 2.0 if api_key else 0.5
+    burst = float(os.getenv("POKEMONTCG_BURST", "4" if api_key else "2"))
+    return get_limiter("pokemontcg", rate, burst)
+
+def _get(sess, limiter, url, headers, params, timeout):
+    """GET pasando por el cache HTTP y el limitador; los 429 frenan a todos los hilos y se reintentan."""
+    cache = get_cache()
+    meta, key = cache.lookup(url, params) if cache else (None, None)
+    if cache and cache.is_fresh(meta):
+        cached = cache.response(key, meta, "fresh")
+        if cached is not None:
+            return cached
+        meta = None
+    req_headers = {**headers, **cache.conditional_headers(meta)} if meta else headers
+
+    attempts = int(os.getenv("POKEMONTCG_RETRIES", "2")) + 1
+    for attempt in range(attempts):
+        limiter.acquire()
+        t0 = time.monotonic()
+        try:
+            r = sess.get(url, headers=req_headers, params=params, timeout=timeout)
+        finally:
+            limiter.record(time.monotonic() - t0)
+            observe("http.pokemontcg", time.monotonic() - t0, kind="timer")
+        record_http("pokemontcg", r)
+        # Reintentos de urllib3 (5xx / conexión) dentro de esta misma llamada.
+        retries = getattr(getattr(r.raw, "retries", None), "history", None)
+        if retries:
+            incr("http.pokemontcg.retries", len(retries))
+        if r.status_code != 429:
+            limiter.success()
+            break
+        wait = parse_retry_after(r.headers.get("Retry-After"), default=2.0 ** attempt)
+        print(f"[pokemontcg] 429 recibido, espero {wait:.1f}s (intento {attempt+1}/{attempts})")
+        incr("http.pokemontcg.retries_429")
+        limiter.backoff(wait)
+
+    if cache:
+        if r.status_code == 304 and meta:
+            cached = cache.response(key, meta, "revalidated")
+            if cached is not None:
+                cache.touch(key, meta)
+                return cached
+            # El cuerpo se desalojó entre lookup y el 304: se repite sin condicionales.
+            return _get(sess, limiter, url, headers, params, timeout)
+        cache.miss()
+        cache.store(key, r)
+    return r
+
+def _ids_query(ids):
+    return " OR ".join(f'id:"{i}"' for i in ids)
+
+def resolve_fingerprint(raw_q, max_cards, index=None):
+    """Huella de cómo se resolvería `raw_q` hoy: si cambian las variantes, el cache no vale."""
+    return ResolveCache.fingerprint(_build_candidate_queries(raw_q, index, max_cards), max_cards)
+
+def _headers(api_key=None, warn=True):
     headers = {
         "Accept": "application/json",
         "User-Agent": "pk-spike-bot/1.1 (+github-actions)"
     }
     if api_key:
         headers["X-Api-Key"] = api_key
-    else:
+    elif warn:
         print("[pokemontcg] WARN: no API key provided (X-Api-Key missing)")
+    return headers
+
+def get_json(endpoint, params, api_key=None):
+    """Una página de `/v2/<endpoint>` (p. ej. sets) por el mismo cache HTTP y limitador que las cartas."""
+    sess = _session()
+    try:
+        r = _get(sess, _limiter(api_key), f"{API_BASE}/{endpoint}", _headers(api_key, warn=False), params,
+                 float(os.getenv("POKEMONTCG_TIMEOUT", "20")))
+        print(f"[pokemontcg] {endpoint} q={params.get('q', '')} page={params.get('page', 1)} status={r.status_code}")
+        r.raise_for_status()
+        return r.json()
+    finally:
+        sess.close()
+
+# Sólo los campos que usa el bot (`select` de la API): sin ataques, habilidades, legalidades ni reglas.
+SELECT_FIELDS = "id,name,set,tcgplayer,cardmarket,images"
+# Orden de preferencia de las variantes de TCGplayer para el precio `now`.
+TCG_VARIANTS = ("holofoil", "reverseHolofoil", "normal", "ultraRare", "1stEditionHolofoil")
+TCG_FIELDS = ("low", "mid", "market", "high")
+
+def _num(v):
+    return float(v) if isinstance(v, (int, float)) else None
+
+class CardRecord:
+    """Carta normalizada: precios por variante de TCGplayer, Cardmarket e imágenes.
+
+    `tcgplayer` es {variante: (low, mid, market, high)}; `now` el market de la primera variante
+    de TCG_VARIANTS que lo tenga o, si no, Cardmarket avg1/avg7/avg30 (None si no hay precio).
+    """
+    __slots__ = ("id", "name", "set_name", "tcgplayer", "cm_avg1", "cm_avg7", "cm_avg30", "cm_trend",
+                 "image_small", "image_large", "now")
+
+    def __init__(self, id, name, set_name, tcgplayer, cm_avg1=None, cm_avg7=None, cm_avg30=None, cm_trend=None,
+                 image_small=None, image_large=None):
+        self.id, self.name, self.set_name, self.tcgplayer = id, name, set_name, tcgplayer
+        self.cm_avg1, self.cm_avg7, self.cm_avg30, self.cm_trend = cm_avg1, cm_avg7, cm_avg30, cm_trend
+        self.image_small, self.image_large = image_small, image_large
+        self.now = next((tcgplayer[k][2] for k in TCG_VARIANTS if k in tcgplayer and tcgplayer[k][2] is not None),
+                        None)
+        if self.now is None:
+            self.now = next((v for v in (cm_avg1, cm_avg7, cm_avg30) if v is not None), None)
+
+    @classmethod
+    def from_api(cls, card: dict) -> "CardRecord":
+        tp = (card.get("tcgplayer") or {}).get("prices") or {}
+        cm = (card.get("cardmarket") or {}).get("prices") or {}
+        images = card.get("images") or {}
+        return cls(card.get("id"), card.get("name"), (card.get("set") or {}).get("name"),
+                   {k: tuple(_num(v.get(f)) for f in TCG_FIELDS) for k, v in tp.items() if isinstance(v, dict)},
+                   _num(cm.get("avg1")), _num(cm.get("avg7")), _num(cm.get("avg30")), _num(cm.get("trendPrice")),
+                   images.get("small"), images.get("large"))
+
+    @property
+    def has_cardmarket(self) -> bool:
+        return any(v is not None for v in (self.cm_avg1, self.cm_avg7, self.cm_avg30, self.cm_trend))
+
+    @property
+    def cm(self) -> tuple:
+        """(avg1, avg7, avg30) tal como se guardan en el historial."""
+        return self.cm_avg1, self.cm_avg7, self.cm_avg30
+
+    def __repr__(self):
+        return f"CardRecord({self.id!r}, now={self.now})"
+
+def fetch_card_entries(queries, api_key=None, max_cards=2, cache=None, index=None):
+    t_start = time.perf_counter()
+    headers = _headers(api_key)
 
     timeout  = float(os.getenv("POKEMONTCG_TIMEOUT", "20"))
-    throttle = float(os.getenv("POKEMONTCG_THROTTLE", "0.50"))
+    limiter = _limiter(api_key)
     sess = _session()
 
     results = []
     for raw_q in queries:
-        for q in _build_candidate_queries(raw_q):
-            params = {"q": q}
+        candidates = _build_candidate_queries(raw_q, index, max_cards)
+        fp = resolve_fingerprint(raw_q, max_cards, index) if cache else None
+        cached_ids = cache.get(raw_q, fp) if cache else None
+        id_q = _ids_query(cached_ids) if cached_ids else None
+        if id_q:
+            # IDs ya resueltos: una sola petición directa; las variantes quedan de respaldo.
+            candidates = [id_q] + candidates
+        for i, q in enumerate(candidates):
+            params = {"q": q, "select": SELECT_FIELDS}
+            # Variante: "ids" (IDs cacheados), "setnum" (set.id + número del índice de sets)
+            # o v0, v1… según su orden en _build_candidate_queries.
+            label = "ids" if q == id_q else ("setnum" if q.startswith("set.id:") else f"v{i - (1 if id_q else 0)}")
+            t_q = time.perf_counter()
             try:
-                r = sess.get(API_URL, headers=headers, params=params, timeout=timeout)
+                r = _get(sess, limiter, API_URL, headers, params, timeout)
                 print("[pokemontcg] q=", q, "status=", r.status_code)
 
                 # Algunos edges devuelven 404 “suave” en búsquedas válidas;
                 # lo tratamos como "sin resultados" y probamos la siguiente variante.
                 if r.status_code == 404:
                     print("[pokemontcg] WARN: 404 recibido (edge). Probando siguiente variante…")
-                    time.sleep(throttle)
+                    incr(f"fetch.variant.{label}.soft404")
                     continue
 
                 r.raise_for_status()
@@ -123,58 +291,130 @@ def fetch_card_entries(queries, api_key=None, max_cards=2):
 
             except requests.exceptions.ReadTimeout as e:
                 print("[pokemontcg] timeout:", str(e)[:200])
-                time.sleep(throttle * 2)
+                incr(f"fetch.variant.{label}.{classify_error(e)}")
+                limiter.backoff()
                 continue
             except requests.exceptions.ConnectionError as e:
                 print("[pokemontcg] connection error:", str(e)[:200])
+                incr(f"fetch.variant.{label}.{classify_error(e)}")
                 # Reset de sesión por si hay socket en mal estado
                 sess.close(); sess = _session()
-                time.sleep(throttle * 2)
-                continue
-            except requests.exceptions.RequestException as e:
-                print("[pokemontcg] network error:", type(e).__name__, str(e)[:200])
-                time.sleep(throttle)
+                limiter.backoff()
                 continue
             except ValueError as e:
+                # JSON inválido (p. ej. una página HTML con 200); también es RequestException.
                 print("[pokemontcg] parse error:", str(e)[:200])
-                time.sleep(throttle)
+                incr(f"fetch.variant.{label}.{classify_error(e)}")
                 continue
+            except requests.exceptions.RequestException as e:
+                print("[pokemontcg] network error:", type(e).__name__, str(e)[:200])
+                incr(f"fetch.variant.{label}.{classify_error(e)}")
+                continue
+            finally:
+                observe("fetch.variant", time.perf_counter() - t_q, kind="timer")
 
+            incr(f"fetch.variant.{label}.{'hit' if data else 'empty'}")
             if not data:
-                time.sleep(throttle)
+                if q == id_q:
+                    print("[pokemontcg] WARN: IDs cacheados sin resultados, re-resolviendo", raw_q)
+                    cache.invalidate(raw_q)
                 continue
 
-            for card in data:
-                entry = {
-                    "name": card.get("name"),
-                    "set": (card.get("set") or {}).get("name")
-                }
-                p_now = None
-                tp = (card.get("tcgplayer") or {}).get("prices") or {}
-                cm = (card.get("cardmarket") or {}).get("prices") or {}
-
-                for k in ["holofoil", "reverseHolofoil", "normal", "ultraRare", "1stEditionHolofoil"]:
-                    if k in tp and "market" in tp[k]:
-                        p_now = tp[k]["market"]; break
-
-                if p_now is None:
-                    for k in ["avg1","avg7","avg30"]:
-                        if k in cm:
-                            p_now = cm[k]; break
-
-                entry["now"] = float(p_now) if p_now is not None else None
-                entry["cardmarket"] = {"prices": cm} if cm else {}
-                images = card.get("images") or {}
-                entry["image_small"] = images.get("small")
-                entry["image_large"] = images.get("large")
-                results.append(entry)
+            if cache and q != id_q and all(c.get("id") for c in data):
+                cache.put(raw_q, fp, [c["id"] for c in data])
+
+            results.extend(CardRecord.from_api(card) for card in data)
 
             if results:
-                time.sleep(throttle)
                 break  # no sigas variantes si ya obtuviste algo
 
-            time.sleep(throttle)
-
+    sess.close()
+    observe("fetch.card_entries", time.perf_counter() - t_start, kind="timer")
     return results
 
 
+
+def fetch_watchlist_entries(watch_queries, api_key=None, max_cards=2, cache=None, index=None):
+    """Precios de muchas cartas con pocas peticiones.
+
+    `watch_queries` es {nombre: [queries]}. Las cartas cuyas queries ya están todas en
+    el cache de resolución se piden juntas con `id:"a" OR id:"b" …` (paginando con
+    pageSize=250) y cada carta devuelta se asigna a su item del watchlist. Devuelve
+    `(entries_por_nombre, pendientes)`: las pendientes (sin IDs cacheados, o cuyo lote
+    falló) se resuelven con `fetch_card_entries` como siempre.
+    """
+    if not cache:
+        return {}, list(watch_queries)
+    wanted, pending = {}, []
+    for name, queries in watch_queries.items():
+        per_query = []
+        for raw_q in queries:
+            fp = resolve_fingerprint(raw_q, max_cards, index)
+            ids = cache.get(raw_q, fp, count=False)
+            if not ids:
+                break
+            per_query.append((raw_q, fp, ids[:max_cards]))
+        if per_query and len(per_query) == len(queries):
+            wanted[name] = per_query
+        else:
+            pending.append(name)
+    if not wanted:
+        return {}, pending
+
+    all_ids = list(dict.fromkeys(i for pq in wanted.values() for _, _, ids in pq for i in ids))
+    per_request = max(1, int(os.getenv("POKEMONTCG_BATCH_IDS", "40")))
+    timeout = float(os.getenv("POKEMONTCG_TIMEOUT", "20"))
+    headers = _headers(api_key)
+    limiter = _limiter(api_key)
+    sess = _session()
+    cards, failed = {}, set()
+    t_start = time.perf_counter()
+    for start in range(0, len(all_ids), per_request):
+        chunk = all_ids[start:start + per_request]
+        q, page, seen = _ids_query(chunk), 1, 0
+        while True:
+            params = {"q": q, "pageSize": 250, "page": page, "select": SELECT_FIELDS}
+            try:
+                r = _get(sess, limiter, API_URL, headers, params, timeout)
+                print(f"[pokemontcg] batch ids={len(chunk)} page={page} status={r.status_code}")
+                r.raise_for_status()
+                payload = r.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print("[pokemontcg] batch error:", type(e).__name__, str(e)[:200])
+                incr(f"fetch.batch.{classify_error(e)}")
+                if isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+                    limiter.backoff()
+                failed.update(chunk)
+                break
+            data = payload.get("data") or []
+            for card in data:
+                if card.get("id"):
+                    cards[card["id"]] = card
+            seen += len(data)
+            if not data or seen >= int(payload.get("totalCount") or 0):
+                break
+            page += 1
+    sess.close()
+    observe("fetch.watchlist_batch", time.perf_counter() - t_start, kind="timer")
+
+    out = {}
+    for name, per_query in wanted.items():
+        entries, ok = [], True
+        for raw_q, _, ids in per_query:
+            found = [cards[i] for i in ids if i in cards]
+            if not found:
+                ok = False
+                if not failed.intersection(ids):
+                    # La API ya no reconoce esos IDs: se re-resuelven por variantes.
+                    cache.invalidate(raw_q)
+                break
+            entries.extend(CardRecord.from_api(c) for c in found)
+        if ok:
+            # El hit se cuenta aquí, una vez; si el lote falla lo cuenta fetch_card_entries.
+            for raw_q, fp, _ in per_query:
+                cache.get(raw_q, fp)
+            out[name] = entries
+        else:
+            pending.append(name)
+    print(f"[pokemontcg] batch: {len(out)} cartas por ID, {len(pending)} pendientes")
+    return out, pending
@@ -0,0 +1,63 @@
+import os, json, hashlib, threading, datetime as dt
+
+class ResolveCache:
+    """Cache en disco: query del watchlist → IDs de carta PokémonTCG ya resueltos.
+
+    Cada entrada guarda una huella de las variantes de búsqueda con las que se resolvió;
+    si cambia la query del config (o cómo se construyen las variantes) la entrada deja de
+    valer. Las entradas caducan tras `ttl_hours`.
+    """
+    def __init__(self, path: str, ttl_hours: float = 168.0):
+        self.path = path
+        self.ttl = dt.timedelta(hours=ttl_hours)
+        self._lock = threading.Lock()
+        self.entries = {}
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "invalidated": 0, "stored": 0}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("entries", {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    @staticmethod
+    def fingerprint(*parts) -> str:
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+    def get(self, query: str, fp: str, count: bool = True):
+        with self._lock:
+            e = self.entries.get(query)
+            if not e or e.get("fp") != fp or not e.get("ids"):
+                if count: self.counters["misses"] += 1
+                return None
+            if dt.datetime.utcnow() - dt.datetime.fromisoformat(e["ts"]) > self.ttl:
+                if count: self.counters["expired"] += 1; self.counters["misses"] += 1
+                return None
+            if count: self.counters["hits"] += 1
+            return list(e["ids"])
+
+    def put(self, query: str, fp: str, ids):
+        with self._lock:
+            self.entries[query] = {"fp": fp, "ids": list(ids), "ts": dt.datetime.utcnow().isoformat()}
+            self.counters["stored"] += 1
+
+    def invalidate(self, query: str):
+        with self._lock:
+            if self.entries.pop(query, None) is not None:
+                self.counters["invalidated"] += 1
+
+    def save(self, keep=None):
+        """Guarda el cache; con `keep` (todas las queries del watchlist) poda las que sobran."""
+        with self._lock:
+            entries = {q: e for q, e in self.entries.items() if q in keep} if keep is not None else self.entries
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"entries": entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+            total = out["hits"] + out["misses"]
+            out["hit_rate"] = round(out["hits"] / total, 3) if total else 0.0
+            out["entries"] = len(self.entries)
+            return out
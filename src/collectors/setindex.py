@@ -0,0 +1,228 @@
+import os, re, json, difflib, threading, unicodedata, datetime as dt
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_NUMBER = re.compile(r"\b(\d{1,3})/\d{1,3}\b")
+# Palabras de la query que piden la versión alternativa/secreta de una carta.
+ALT_HINTS = {"alternate", "alt", "secret"}
+# Rarezas que sólo cuentan si la query las nombra (si no, se prefiere la versión normal del arte).
+EXCLUSIVE_RARITY = {"rainbow", "hyper", "gold", "shiny"}
+FUZZY_CUTOFF = 0.85
+
+def norm(text: str) -> str:
+    """Minúsculas, sin acentos ni apóstrofos y sólo [a-z0-9] separados por un espacio."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return " ".join(_NON_ALNUM.sub(" ", text.lower().replace("'", "")).split())
+
+class SetIndex:
+    """Índice local (data/set_index.json) de sets y nombres de carta de PokémonTCG.
+
+    Los sets se bajan de /v2/sets una vez por `ttl_hours`; la lista de cartas (id, número,
+    nombre, rareza) de un set sólo cuando alguna query lo nombra. `resolve` convierte una
+    query del watchlist en set + números de carta por coincidencia de tokens (con difflib
+    para erratas), así el colector pide `set.id:"…" number:"…"` en vez de `name:Lugia*`.
+    `fetch(endpoint, params)` devuelve el JSON de una página de la API.
+    """
+    def __init__(self, path: str, fetch, ttl_hours: float = 168.0):
+        self.path = path
+        self.fetch = fetch
+        self.ttl = dt.timedelta(hours=ttl_hours)
+        self._lock = threading.Lock()
+        self._cv = threading.Condition(self._lock)
+        self._memo = {}
+        self._failed = set()
+        self._inflight = set()  # "sets" o set_id que algún hilo está bajando
+        self.dirty = False
+        self.counters = {"resolved": 0, "unresolved": 0, "refreshed": 0, "fetch_errors": 0}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            self.sets, self.cards = raw.get("sets") or {}, raw.get("cards") or {}
+        except (OSError, ValueError, AttributeError):
+            self.sets, self.cards = {}, {}
+        self._build_keys()
+
+    def _expired(self, ts) -> bool:
+        return not ts or dt.datetime.utcnow() - dt.datetime.fromisoformat(ts) > self.ttl
+
+    def _pages(self, endpoint, params):
+        page, out = 1, []
+        while True:
+            payload = self.fetch(endpoint, {**params, "pageSize": 250, "page": page})
+            data = payload.get("data") or []
+            out.extend(data)
+            if not data or len(out) >= int(payload.get("totalCount") or 0):
+                return out
+            page += 1
+
+    def _build_keys(self):
+        # (clave normalizada con espacios alrededor, set_id): primero las más largas y, a igual
+        # clave, el set más reciente; así "ex deoxys" gana a "deoxys" y un substring es un token.
+        keys = []
+        for sid, s in self.sets.get("data", {}).items():
+            name = norm(s.get("name"))
+            for k in {name, norm(f"{s.get('series', '')} {s.get('name', '')}"), norm(sid), norm(s.get("ptcgoCode"))}:
+                if len(k) >= 3:
+                    keys.append((k, s.get("releaseDate") or "", sid))
+        keys.sort(key=lambda k: k[1], reverse=True)
+        keys.sort(key=lambda k: -len(k[0]))  # estable: a igual longitud queda la fecha descendente
+        self._keys = [(f" {k} ", sid) for k, _, sid in keys]
+        self._names = {norm(s.get("name")): sid for sid, s in self.sets.get("data", {}).items() if s.get("name")}
+
+    def _claim(self, key, fresh) -> bool:
+        """True si este hilo debe bajar `key`; si otro ya la está bajando, espera a que termine.
+
+        El lock sólo se toma para comprobar y marcar: la descarga va fuera de él.
+        """
+        with self._cv:
+            while key in self._inflight:
+                self._cv.wait()
+            if key in self._failed or fresh():
+                return False
+            self._inflight.add(key)
+            return True
+
+    def _release(self, key, failed=False):
+        with self._cv:
+            self._inflight.discard(key)
+            if failed:
+                # Se sigue con el índice viejo (o sin índice) y no se reintenta en esta corrida.
+                self._failed.add(key); self.counters["fetch_errors"] += 1
+            self._cv.notify_all()
+
+    def _sets_fresh(self) -> bool:
+        return not self._expired(self.sets.get("ts"))
+
+    def _cards_fresh(self, sid) -> bool:
+        c = self.cards.get(sid)
+        return bool(c) and not self._expired(c.get("ts"))
+
+    def _ensure_sets(self):
+        if "sets" in self._failed or self._sets_fresh() or not self._claim("sets", self._sets_fresh):
+            return
+        failed = False
+        try:
+            data = self._pages("sets", {"orderBy": "releaseDate"})
+            sets = {"ts": dt.datetime.utcnow().isoformat(),
+                    "data": {s["id"]: {k: s.get(k) for k in ("name", "series", "ptcgoCode",
+                                                            "printedTotal", "releaseDate")}
+                             for s in data if s.get("id")}}
+            with self._lock:
+                self.sets = sets
+                self.counters["refreshed"] += 1
+                self.dirty = True
+                self._memo.clear()
+                self._build_keys()
+        except Exception as e:
+            print("[set-index] WARN: no pude bajar /v2/sets:", type(e).__name__, str(e)[:200])
+            failed = True
+        finally:
+            self._release("sets", failed)
+
+    def _set_cards(self, sid):
+        if sid not in self._failed and not self._cards_fresh(sid) and self._claim(sid, lambda: self._cards_fresh(sid)):
+            failed = False
+            try:
+                data = self._pages("cards", {"q": f'set.id:"{sid}"', "select": "id,name,number,rarity"})
+                cards = [[d.get("id"), str(d.get("number") or ""), d.get("name") or "", d.get("rarity") or ""]
+                         for d in data]
+                with self._lock:
+                    self.cards[sid] = {"ts": dt.datetime.utcnow().isoformat(), "cards": cards}
+                    self.counters["refreshed"] += 1
+                    self.dirty = True
+            except Exception as e:
+                print(f"[set-index] WARN: no pude bajar las cartas de {sid}:", type(e).__name__, str(e)[:200])
+                failed = True
+            finally:
+                self._release(sid, failed)
+        return (self.cards.get(sid) or {}).get("cards") or []
+
+    def match_set(self, text: str):
+        """(set_id, clave normalizada que coincidió) o (None, None)."""
+        q = f" {norm(text)} "
+        for key, sid in self._keys:
+            if key in q:
+                return sid, key.strip()
+        # Erratas ("Evolving Skys"): n-gramas de la query contra los nombres de set.
+        tokens, best = q.split(), (0.0, None, None)
+        for n in range(min(4, len(tokens)), 0, -1):
+            for i in range(len(tokens) - n + 1):
+                gram = " ".join(tokens[i:i + n])
+                if len(gram) < 5:
+                    continue
+                for name in difflib.get_close_matches(gram, self._names, n=1, cutoff=FUZZY_CUTOFF):
+                    score = difflib.SequenceMatcher(None, gram, name).ratio() * len(name)
+                    if score > best[0]:
+                        best = (score, self._names[name], gram)
+        return best[1], best[2]
+
+    def match_cards(self, sid: str, text: str, set_key: str = "", max_cards: int = 2):
+        """Números de las cartas del set cuyo nombre aparece entero en la query, mejor puntuadas primero."""
+        cards = self._set_cards(sid)
+        m = _NUMBER.search(text)
+        if m:
+            wanted = m.group(1).lstrip("0") or "0"
+            exact = [c[1] for c in cards if c[1].lstrip("0") == wanted]
+            if exact:
+                return exact[:1]
+        q = f" {norm(text)} "
+        if set_key:
+            q = q.replace(f" {set_key} ", " ")
+        q_tokens = q.split()
+        q_set = set(q_tokens)
+        alt = bool(ALT_HINTS & q_set)
+        printed = int((self.sets.get("data", {}).get(sid) or {}).get("printedTotal") or 0)
+        scored = []
+        for _, number, name, rarity in cards:
+            n_tokens = norm(name).split()
+            missing = [t for t in n_tokens if t not in q_set]
+            # Erratas sólo en palabras (no "Benchcard0001" ≈ "Benchcard1001"); cada una resta frente a un acierto exacto.
+            if not n_tokens or not all(len(t) >= 4 and not any(ch.isdigit() for ch in t)
+                                       and difflib.get_close_matches(t, q_tokens, n=1, cutoff=FUZZY_CUTOFF)
+                                       for t in missing):
+                continue
+            # Rareza: cuenta lo que la query nombra además del nombre ("special illustration", "star").
+            r_tokens = set(norm(rarity).split()) - {"rare"} - set(n_tokens)
+            score = (10 * len(n_tokens) - 5 * len(missing) + len(r_tokens & q_set)
+                     - len((r_tokens & EXCLUSIVE_RARITY) - q_set))
+            num = int(number) if number.isdigit() else 0
+            if alt and printed and num > printed:
+                score += 1
+            scored.append((score, num if alt else -num, number))
+        if not scored:
+            return []
+        scored.sort(reverse=True)
+        return [number for score, _, number in scored if score == scored[0][0]][:max_cards]
+
+    def resolve(self, text: str, max_cards: int = 2):
+        """{"set_id", "set_name", "numbers"} para la query, o None si el índice no la reconoce."""
+        key = (text, max_cards)
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        self._ensure_sets()
+        out = None
+        sid, set_key = self.match_set(text)
+        if sid:
+            numbers = self.match_cards(sid, text, set_key, max_cards)
+            out = {"set_id": sid, "set_name": self.sets["data"][sid].get("name"), "numbers": numbers}
+        with self._lock:
+            self.counters["resolved" if out and out["numbers"] else "unresolved"] += 1
+            self._memo[key] = out
+        return out
+
+    def save(self):
+        if not self.dirty:
+            return
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"sets": self.sets, "cards": self.cards}, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+            out["sets"] = len(self.sets.get("data", {}))
+            out["indexed_sets"] = len(self.cards)
+        return out
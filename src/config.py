@@ -0,0 +1,44 @@
+import os, re, json, hashlib
+
+CONFIG_FILE = os.getenv("PK_CONFIG") or os.path.join(os.path.dirname(__file__), "..", "config.yaml")
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", ".cache", "config")
+# Sólo los archivos con este nombre son del cache: CONFIG_CACHE_DIR puede ser una carpeta compartida.
+CACHE_NAME = re.compile(r"config-[0-9a-f]{16}\.json")
+
+def load_config(path: str = CONFIG_FILE) -> dict:
+    """config.yaml ya parseado, cacheado como JSON en .cache/config/config-<sha1 del archivo>.json.
+
+    Con el cache al día no se importa `yaml` (lo más lento de arrancar) ni se vuelve a parsear:
+    sólo se lee el archivo para calcular su hash. Cualquier cambio en el YAML da otro hash y se
+    reparsea. `CONFIG_CACHE=0` lo desactiva; `CONFIG_CACHE_DIR` cambia la carpeta.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    if os.getenv("CONFIG_CACHE", "true").lower() not in ("1", "true", "yes"):
+        return _parse(raw)
+    cache_dir = os.getenv("CONFIG_CACHE_DIR", CACHE_DIR)
+    cached = os.path.join(cache_dir, f"config-{hashlib.sha1(raw).hexdigest()[:16]}.json")
+    try:
+        with open(cached, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    cfg = _parse(raw)
+    try:
+        text = json.dumps(cfg, ensure_ascii=False, separators=(",", ":"))
+        os.makedirs(cache_dir, exist_ok=True)
+        for old in os.listdir(cache_dir):
+            if CACHE_NAME.fullmatch(old):
+                os.remove(os.path.join(cache_dir, old))
+        tmp = cached + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, cached)
+    except (OSError, TypeError, ValueError) as e:
+        # Valores que JSON no representa (fechas de YAML, etc.) o disco de sólo lectura: sin cache.
+        print("[config] WARN: no pude cachear el config:", type(e).__name__, str(e)[:200])
+    return cfg
+
+def _parse(raw: bytes) -> dict:
+    import yaml
+    return yaml.safe_load(raw)
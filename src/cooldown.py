@@ -0,0 +1,64 @@
+import os, json, threading
+
+HOUR = 3600.0
+
+class AlertIndex:
+    """Última alerta enviada por carta (data/alert_state.json) para no repetirla en cada corrida.
+
+    Dentro del cooldown una carta sólo vuelve a alertar si escala: precio un `step` por
+    encima del de la última alerta (nuevo máximo) o Δ24h/Δ7d `step` puntos mayores.
+    Pasado el cooldown la entrada deja de contar y se borra al guardar.
+    La entrada se anota cuando Telegram confirma el envío (`delivered`, desde el hilo del
+    dispatcher), no al encolar: una alerta que acaba en el outbox no silencia la carta.
+    """
+    def __init__(self, path: str, cooldown_hours: float = 24.0, step: float = 0.05):
+        self.path = path
+        self.cooldown = cooldown_hours * HOUR
+        self.step = step
+        self.suppressed = 0
+        self.cards = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            self.cards = {k: v for k, v in raw.items() if isinstance(v, dict)}
+        except (OSError, ValueError, AttributeError):
+            self.cards = {}
+
+    def should_alert(self, key: str, now: float, price: float, pct_24h: float, pct_7d: float) -> bool:
+        if self.cooldown <= 0:
+            return True
+        with self._lock:
+            last = self.cards.get(key)
+        if not last or now - last.get("ts", 0) >= self.cooldown:
+            return True
+        escalated = (price > last.get("price", 0) * (1 + self.step)
+                     or pct_24h > last.get("pct_24h", 0) + self.step
+                     or pct_7d > last.get("pct_7d", 0) + self.step)
+        if not escalated:
+            self.suppressed += 1
+        return escalated
+
+    def record(self, key: str, now: float, price: float, pct_24h: float, pct_7d: float):
+        with self._lock:
+            self.cards[key] = {"ts": round(now, 1), "price": round(price, 4),
+                               "pct_24h": round(pct_24h, 4), "pct_7d": round(pct_7d, 4)}
+
+    def delivered(self, msg: dict):
+        """`on_sent` del dispatcher: anota la alerta si el mensaje lleva su entrada de cooldown."""
+        entry = msg.get("cooldown")
+        if entry:
+            self.record(entry["key"], *entry["signal"])
+
+    def save(self, now: float):
+        with self._lock:
+            keep = {k: v for k, v in sorted(self.cards.items()) if now - v.get("ts", 0) < self.cooldown}
+        if not keep and not os.path.exists(self.path):
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(keep, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def stats(self) -> dict:
+        return {"cooldown_hours": self.cooldown / HOUR, "active": len(self.cards), "suppressed": self.suppressed}
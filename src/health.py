@@ -1,15 +1,50 @@
-import os, json, html
+import os, json, html, contextlib
 from .utils import ensure_dir
 
-DOCS_DIR = os.path.join(os.path.dirname(__file__), "..", "docs")
-DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+DOCS_DIR = os.getenv("PK_DOCS_DIR") or os.path.join(os.path.dirname(__file__), "..", "docs")
+DATA_DIR = os.getenv("PK_DATA_DIR") or os.path.join(os.path.dirname(__file__), "..", "data")
 
-def write_health(stats: dict):
-    ensure_dir(DOCS_DIR)
+def _ratelimit_html(limiters: dict) -> str:
+    if not limiters:
+        return ""
+    out = ["<h2>Rate limit</h2>", "<div>"]
+    for name, lim in limiters.items():
+        out.append(f'<span class="badge">{html.escape(name)}: {lim.get("requests",0)} req · '
+                   f'espera {lim.get("wait_sec",0):.1f}s · en petición {lim.get("request_sec",0):.1f}s · '
+                   f'429: {lim.get("throttled",0)} · ritmo {lim.get("rate",0):.2f}/{lim.get("max_rate",0):.2f} req/s</span>')
+    out.append("</div>")
+    return "\n".join(out)
+
+def _metrics_html(m: dict) -> str:
+    if not m or not (m.get("timers") or m.get("counters")):
+        return ""
+    out = ["<h2>Tiempos por etapa</h2>", "<table>",
+           "<thead><tr><th>etapa</th><th>n</th><th>p50 (s)</th><th>p95 (s)</th><th>máx (s)</th><th>total (s)</th></tr></thead><tbody>"]
+    for name, t in m.get("timers", {}).items():
+        out.append(f"<tr><td>{html.escape(name)}</td><td>{t['count']}</td><td>{t['p50']:.3f}</td><td>{t['p95']:.3f}</td>"
+                   f"<td>{t['max']:.3f}</td><td>{t['total']:.2f}</td></tr>")
+    out.append("</tbody></table>")
+    counters = m.get("counters", {})
+    if counters:
+        out.append("<div style=\"margin-top:10px\">")
+        out.extend(f'<span class="badge">{html.escape(k)}: {v}</span>' for k, v in counters.items())
+        out.append("</div>")
+    return "\n".join(out)
+
+def _item_row(item: dict) -> str:
+    note = html.escape(item.get("note",""))
+    return f"<tr><td>{html.escape(item.get('name',''))}</td><td>{item.get('entries',0)}</td><td>${item.get('price_now',0):.2f}</td><td>{item.get('pct_24h',0)*100:.1f}%</td><td>{item.get('pct_7d',0)*100:.1f}%</td><td>{'✅' if item.get('breakout') else '—'}</td><td>{'📣' if item.get('alerted') else '—'}</td><td>{note}</td></tr>\n"
 
-    # Guardamos el JSON de estado (útil para depuración)
-    with open(os.path.join(DATA_DIR, "status.json"), "w", encoding="utf-8") as f:
-        json.dump(stats, f, ensure_ascii=False, indent=2)
+def write_health(stats: dict, save_status: bool = True, items=None):
+    """docs/health.html y data/status.json.
+
+    `items` (iterable, p. ej. RunCheckpoint.iter_items()) sustituye a stats["items"] y se
+    recorre una sola vez escribiendo ambos archivos, sin juntar la lista en memoria.
+    """
+    ensure_dir(DOCS_DIR)
+    if items is None:
+        items = stats.get("items", [])
+    head = {k: v for k, v in stats.items() if k != "items"}
 
     # f-string: OJO con las llaves. En CSS ya están escapadas con {{ }}.
     # En JS eliminamos `${...}` para no chocar con el f-string de Python.
@@ -41,7 +76,7 @@ window.addEventListener('DOMContentLoaded', () => {{
 </script>
 </head><body>
 <h1>Health Dashboard</h1>
-<div class="small">Started: {html.escape(stats.get('started',''))} UTC · Duration: {stats.get('duration_sec',0):.1f}s · Batch: {stats.get('batch_size',0)} · Processed: {stats.get('processed',0)}/{stats.get('cards_total',0)}</div>
+<div class="small">Started: {html.escape(stats.get('started',''))} UTC · Duration: {stats.get('duration_sec',0):.1f}s · Batch: {stats.get('batch_size',0)} · Concurrencia: {stats.get('concurrency',1)} · Retomadas: {stats.get('resumed',0)} · Processed: {stats.get('processed',0)}/{stats.get('cards_total',0)}</div>
 <div style="margin-top:10px;">
   <a class="btn actions-link" href="#" target="_blank">🔁 Abrir "Run workflow"</a>
   <a class="btn actions-link" href="#" target="_blank">📣 Abrir y activar send_ping</a>
@@ -53,20 +88,44 @@ window.addEventListener('DOMContentLoaded', () => {{
   <span class="badge">net_errors: {stats.get('net_errors',0)}</span>
   <span class="badge">parse_errors: {stats.get('parse_errors',0)}</span>
   <span class="badge">alerts_sent: {stats.get('alerts_sent',0)}</span>
+  <span class="badge">http_cache: {(stats.get('http_cache') or {}).get('fresh_hits',0)} frescas / {(stats.get('http_cache') or {}).get('revalidated',0)} 304 / {(stats.get('http_cache') or {}).get('misses',0)} red</span>
+  <span class="badge">telegram: {(stats.get('telegram') or {}).get('sent',0)} enviadas / {(stats.get('telegram') or {}).get('failed',0)} fallidas / {(stats.get('telegram') or {}).get('outbox',0)} en outbox</span>
+  <span class="badge">schedule: {(stats.get('schedule') or {}).get('overdue',0)} vencidas · máx {(stats.get('schedule') or {}).get('max_staleness_h') or 0}h sin refrescar</span>
+  <span class="badge">cooldown: {(stats.get('alert_cooldown') or {}).get('suppressed',0)} omitidas</span>
+  <span class="badge">resolve_cache: {(stats.get('resolve_cache') or {}).get('hits',0)} hits / {(stats.get('resolve_cache') or {}).get('misses',0)} misses</span>
 </div>
+{_ratelimit_html(stats.get('ratelimit'))}
+{_metrics_html(stats.get('metrics'))}
 <h2>Cartas procesadas</h2>
 <table>
   <thead><tr><th>Carta</th><th>entries</th><th>precio_now</th><th>Δ24h</th><th>Δ7d</th><th>breakout</th><th>alertada</th><th>nota</th></tr></thead>
   <tbody>
 """
-    for item in stats.get("items", []):
-        note = html.escape(item.get("note",""))
-        health_html += f"<tr><td>{html.escape(item.get('name',''))}</td><td>{item.get('entries',0)}</td><td>${item.get('price_now',0):.2f}</td><td>{item.get('pct_24h',0)*100:.1f}%</td><td>{item.get('pct_7d',0)*100:.1f}%</td><td>{'✅' if item.get('breakout') else '—'}</td><td>{'📣' if item.get('alerted') else '—'}</td><td>{note}</td></tr>\n"
-    health_html += """
+    tail = """
   </tbody>
 </table>
 <p class="small">Tip: los botones abren la página del workflow. Allí puedes marcar <i>send_ping</i> y/o <i>force_test_alert</i> y presionar <b>Run workflow</b>.</p>
 </body></html>
 """
-    with open(os.path.join(DOCS_DIR, "health.html"), "w", encoding="utf-8") as f:
+    # Guardamos el JSON de estado (útil para depuración); `python -m src health` sólo re-renderiza.
+    # Ambos se escriben a un .tmp y se reemplazan al final: un error a mitad deja los anteriores.
+    html_file, status_file = os.path.join(DOCS_DIR, "health.html"), os.path.join(DATA_DIR, "status.json")
+    with open(html_file + ".tmp", "w", encoding="utf-8") as f, \
+            (open(status_file + ".tmp", "w", encoding="utf-8") if save_status else contextlib.nullcontext()) as status:
         f.write(health_html)
+        if status:
+            # Una clave por línea y "items" al final, un item por línea según se leen.
+            status.write("{")
+            for k, v in head.items():
+                status.write(f"\n  {json.dumps(k)}: {json.dumps(v, ensure_ascii=False)},")
+            status.write('\n  "items": [')
+        for i, item in enumerate(items):
+            f.write(_item_row(item))
+            if status:
+                status.write(("," if i else "") + "\n    " + json.dumps(item, ensure_ascii=False))
+        f.write(tail)
+        if status:
+            status.write("\n  ]\n}\n")
+    os.replace(html_file + ".tmp", html_file)
+    if save_status:
+        os.replace(status_file + ".tmp", status_file)
@@ -0,0 +1,81 @@
+import time, random, threading
+from contextlib import contextmanager
+import requests
+
+RESERVOIR = 2048  # muestras por histograma (muestreo de reservorio más allá de esto)
+
+class Histogram:
+    """Cuenta, suma y máximo exactos; percentiles sobre una muestra acotada."""
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self):
+        self.count, self.total, self.max, self.samples = 0, 0.0, 0.0, []
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.samples) < RESERVOIR:
+            self.samples.append(value)
+        else:
+            j = random.randrange(self.count)
+            if j < RESERVOIR:
+                self.samples[j] = value
+
+    def snapshot(self, digits: int = 4) -> dict:
+        s = sorted(self.samples)
+        pct = lambda q: round(s[min(len(s) - 1, int(q * len(s)))], digits) if s else 0.0
+        return {"count": self.count, "total": round(self.total, digits), "p50": pct(0.5),
+                "p95": pct(0.95), "max": round(self.max, digits)}
+
+_LOCK = threading.Lock()
+_TIMERS, _HISTS, _COUNTERS = {}, {}, {}
+
+def incr(name: str, n: int = 1):
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+def observe(name: str, value: float, kind: str = "hist"):
+    """Añade una observación; kind="timer" para segundos (sección `timers` del snapshot)."""
+    table = _TIMERS if kind == "timer" else _HISTS
+    with _LOCK:
+        h = table.get(name)
+        if h is None:
+            h = table[name] = Histogram()
+        h.add(value)
+
+@contextmanager
+def timer(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, kind="timer")
+
+def record_http(source: str, response):
+    """Código de estado y bytes de una respuesta real (las servidas desde el cache no cuentan)."""
+    incr(f"http.{source}.status.{response.status_code}")
+    size = len(response.content or b"")
+    incr(f"http.{source}.bytes", size)
+    observe(f"http.{source}.bytes", size)
+
+def classify_error(exc: BaseException) -> str:
+    """timeout / net / parse / other según el tipo de excepción, no su mensaje."""
+    if isinstance(exc, requests.exceptions.Timeout):
+        return "timeout"
+    # Antes que RequestException: requests.exceptions.JSONDecodeError hereda de las dos.
+    if isinstance(exc, (ValueError, KeyError)):
+        return "parse"
+    if isinstance(exc, requests.exceptions.RequestException):
+        return "net"
+    return "other"
+
+def snapshot() -> dict:
+    with _LOCK:
+        return {"timers": {k: h.snapshot() for k, h in sorted(_TIMERS.items())},
+                "histograms": {k: h.snapshot(1) for k, h in sorted(_HISTS.items())},
+                "counters": dict(sorted(_COUNTERS.items()))}
+
+def reset():
+    with _LOCK:
+        _TIMERS.clear(); _HISTS.clear(); _COUNTERS.clear()
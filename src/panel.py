@@ -1,47 +1,187 @@
-import os, csv, glob
-from .utils import ensure_dir
-DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
-DOCS_DIR = os.path.join(os.path.dirname(__file__), "..", "docs")
-def summarize_card(csv_path):
-    name = os.path.splitext(os.path.basename(csv_path))[0].replace("-", " ").title()
-    rows = []
-    with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            try:
-                rows.append({"ts": r.get("ts",""),
-                             "price_now": float(r.get("price_now",0) or 0),
-                             "market_now": float(r.get("market_now",0) or 0)})
-            except: pass
-    if not rows: return None
-    last = rows[-1]; p_now = last["price_now"]
-    p_24h = rows[-2]["price_now"] if len(rows)>1 else p_now
-    p_7d  = rows[0]["price_now"]
+import os, csv, io, glob, json, html, datetime as dt
+from bisect import bisect_left, bisect_right
+from string import Template
+from .utils import ensure_dir, iso_to_epoch, load_window, last_csv_ts, write_if_changed
+from .store import HistoryStore, use_sqlite
+from .rollups import Rollups
+DATA_DIR = os.getenv("PK_DATA_DIR") or os.path.join(os.path.dirname(__file__), "..", "data")
+DOCS_DIR = os.getenv("PK_DOCS_DIR") or os.path.join(os.path.dirname(__file__), "..", "docs")
+STATE_VERSION = 3
+DAY = 86400.0
+SUMMARY_DAYS = 7
+FIELDS = ["name","price_now","market_now","pct_24h","pct_7d","breakout","source"]
+# Plantillas compiladas una vez al importar el módulo. El JS evita `$` para no chocar con Template.
+PAGE = Template("""<!doctype html><html><head><meta charset='utf-8'><title>Pokémon Panel</title>
+<style>body{font-family:Arial,sans-serif;padding:20px;}table{border-collapse:collapse;width:100%;}th,td{border:1px solid #ddd;padding:8px;}th{background:#f5f5f5}
+button.chart{border:0;background:none;cursor:pointer} #chart{display:none;margin:16px 0} #chart canvas{width:100%;height:260px;border:1px solid #ddd}</style></head><body>
+<h1>Pokémon Price Panel</h1>
+<p><a href='health.html'>Ver Health Dashboard</a></p>
+<div id="chart"><b id="chart-title"></b>
+<select id="chart-res"><option value="h">14 días (por hora)</option><option value="d" selected>3 años (por día)</option><option value="w">todo (por semana)</option></select>
+<canvas width="1000" height="260"></canvas></div>
+<table><thead><tr><th>Carta</th><th>Ahora</th><th>Market</th><th>Δ24h</th><th>Δ7d</th><th>Breakout</th><th>Fuente</th><th></th></tr></thead><tbody>
+$rows
+</tbody></table>
+<script>
+// Las barras ([inicio, open, high, low, close, n]) se piden sólo al abrir una carta o cambiar el zoom.
+var current = null, cache = {};
+function draw(bars) {
+  var cv = document.querySelector('#chart canvas'), g = cv.getContext('2d');
+  g.clearRect(0, 0, cv.width, cv.height);
+  if (!bars.length) return;
+  var lo = Math.min.apply(null, bars.map(function (b) { return b[3]; }));
+  var hi = Math.max.apply(null, bars.map(function (b) { return b[2]; }));
+  var x = function (i) { return 10 + i * (cv.width - 20) / Math.max(bars.length - 1, 1); };
+  var y = function (p) { return cv.height - 10 - (p - lo) * (cv.height - 20) / ((hi - lo) || 1); };
+  g.strokeStyle = '#ccc';
+  bars.forEach(function (b, i) { g.beginPath(); g.moveTo(x(i), y(b[2])); g.lineTo(x(i), y(b[3])); g.stroke(); });
+  g.strokeStyle = '#1565c0'; g.beginPath();
+  bars.forEach(function (b, i) { if (i) g.lineTo(x(i), y(b[4])); else g.moveTo(x(i), y(b[4])); });
+  g.stroke();
+}
+function load() {
+  var key = current + '.' + document.getElementById('chart-res').value;
+  if (cache[key]) return draw(cache[key]);
+  fetch('rollups/' + key + '.json').then(function (r) { return r.ok ? r.json() : []; })
+    .then(function (bars) { cache[key] = bars; draw(bars); });
+}
+function show(slug, name) {
+  current = slug;
+  document.getElementById('chart').style.display = 'block';
+  document.getElementById('chart-title').textContent = name + ' ';
+  load();
+}
+document.getElementById('chart-res').addEventListener('change', function () { if (current) load(); });
+</script>
+</body></html>""")
+ROW = Template("<tr><td>$name</td><td>$$$price_now</td><td>$$$market_now</td><td>$pct_24h%</td><td>$pct_7d%</td><td>$breakout</td><td>$source</td>"
+               "<td><button class='chart' onclick=\"show('$slug', this.closest('tr').cells[0].textContent)\">📈</button></td></tr>")
+def _summarize(name, ts, prices, market_now):
+    """Δ24h/Δ7d contra el último precio en o antes de -24h/-7d (o el más antiguo leído),
+    medidos desde la última muestra; breakout contra el máximo de los 7 días previos."""
+    if not len(ts): return None
+    now, p_now = ts[-1], prices[-1]
+    def anchor(seconds):
+        return prices[max(bisect_right(ts, now - seconds) - 1, 0)]
+    p_24h, p_7d = anchor(DAY), anchor(SUMMARY_DAYS * DAY)
     pct_24h = (p_now - p_24h)/p_24h if p_24h else 0
     pct_7d  = (p_now - p_7d)/p_7d if p_7d else 0
-    breakout = p_now > max([r["price_now"] for r in rows])
-    return {"name": name, "price_now": p_now, "market_now": last["market_now"],
-            "pct_24h": pct_24h, "pct_7d": pct_7d, "breakout": breakout}
-def build_panel():
+    prev = prices[bisect_left(ts, now - SUMMARY_DAYS * DAY):-1]
+    breakout = len(prev) > 0 and p_now > max(prev)
+    return {"name": name, "price_now": p_now, "market_now": market_now,
+            "pct_24h": pct_24h, "pct_7d": pct_7d, "breakout": breakout, "source": None}
+def _card_name(card):
+    return card.replace("-", " ").title()
+def _days_since(last):
+    # load_window corta por días contados desde ahora.
+    return (dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc).timestamp() - last) / DAY
+def summarize_card(csv_path):
+    last = last_csv_ts(csv_path)
+    if last is None: return None
+    # Sólo se lee la cola del CSV: 7 días (+1 para el anclaje) antes de la última fila.
+    days = _days_since(last) + SUMMARY_DAYS + 1
+    ts, prices = load_window(csv_path, days, max_rows=10**6)
+    market = load_window(csv_path, days, max_rows=10**6, column="market_now")[1]
+    return _summarize(_card_name(os.path.splitext(os.path.basename(csv_path))[0]), ts, prices,
+                      market[-1] if market else 0.0)
+def summarize_store_card(store, card, days=SUMMARY_DAYS):
+    last = store.tail(card, 1)
+    if not last: return None
+    # Sólo se lee la ventana de `days` días (+1 para el anclaje) sobre el índice (card, ts).
+    since = (dt.datetime.fromisoformat(last[0][0]) - dt.timedelta(days=days + 1)).isoformat()
+    rows = store.range(card, since=since)
+    out = _summarize(_card_name(card), [iso_to_epoch(t) for t, _, _ in rows], [float(p or 0) for _, p, _ in rows],
+                     float(last[0][2] or 0))
+    if out:
+        out["source"] = store.price_source(card)
+    return out
+def _new_samples(store, card_or_path, last):
+    """(ts epoch, precios) posteriores a `last` (todo el historial si es None) para los rollups."""
+    if store is not None:
+        since = dt.datetime.utcfromtimestamp(last).isoformat() if last else None
+        rows = store.range(card_or_path, since=since)
+        return [iso_to_epoch(t) for t, _, _ in rows], [float(p or 0) for _, p, _ in rows]
+    return load_window(card_or_path, _days_since(last) + 1 if last else 365000, max_rows=10**9)
+def _load_state(path, backend):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        if raw.get("version") == STATE_VERSION and raw.get("backend") == backend:
+            return raw.get("cards", {})
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {}
+def _with_source(summary, source):
+    if summary is not None and source:
+        summary["source"] = source
+    return summary
+def build_panel(store=None, changed=None, sources=None):
+    """Regenera docs/ recalculando sólo las cartas que cambiaron.
+
+    Los resúmenes se guardan en data/panel_state.json con una huella por carta: (mtime, tamaño)
+    del CSV, o el último ts en SQLite. `run.main` pasa su store abierto y en `changed` los slugs
+    a los que acaba de añadir filas, así no hace falta consultar la huella del resto.
+    Esas mismas cartas integran sus muestras nuevas en los rollups de docs/rollups/.
+    `sources` ({slug: serie}) es de dónde salió el precio de cada carta en esta corrida; con
+    SQLite se lee de la columna `price_source`, con CSV sólo se conoce por aquí (o del estado).
+    """
+    sources = sources or {}
     ensure_dir(DOCS_DIR)
-    card_csvs = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    summary = []
-    for path in card_csvs:
-        s = summarize_card(path)
-        if s: summary.append(s)
-    fields = ["name","price_now","market_now","pct_24h","pct_7d","breakout"]
-    with open(os.path.join(DOCS_DIR, "data.csv"), "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fields); w.writeheader()
-        for r in summary: w.writerow(r)
-    html = ["<!doctype html><html><head><meta charset='utf-8'><title>Pokémon Panel</title>",
-            "<style>body{font-family:Arial,sans-serif;padding:20px;}table{border-collapse:collapse;width:100%;}th,td{border:1px solid #ddd;padding:8px;}th{background:#f5f5f5}</style></head><body>",
-            "<h1>Pokémon Price Panel</h1>",
-            "<p><a href='health.html'>Ver Health Dashboard</a></p>",
-            "<table><thead><tr><th>Carta</th><th>Ahora</th><th>Market</th><th>Δ24h</th><th>Δ7d</th><th>Breakout</th></tr></thead><tbody>"]
-    for r in summary:
-        html.append(f"<tr><td>{r['name']}</td><td>${r['price_now']:.2f}</td><td>${r['market_now']:.2f}</td><td>{r['pct_24h']*100:.1f}%</td><td>{r['pct_7d']*100:.1f}%</td><td>{'✅' if r['breakout'] else '—'}</td></tr>")
-    html.append("</tbody></table></body></html>")
-    with open(os.path.join(DOCS_DIR, "index.html"), "w", encoding="utf-8") as f:
-        f.write("\n".join(html))
+    db_file = os.path.join(DATA_DIR, "history.sqlite")
+    # Sin history.sqlite todavía (árbol nuevo o recién migrado) el historial está en los CSV.
+    backend = "sqlite" if use_sqlite() and (store is not None or os.path.exists(db_file)) else "csv"
+    state_file = os.path.join(DATA_DIR, "panel_state.json")
+    cached = _load_state(state_file, backend)
+    rollups = Rollups(DOCS_DIR)
+    own_store = False
+    if backend == "sqlite" and store is None:
+        store, own_store = HistoryStore(db_file), True
+    state, recomputed = {}, 0
+    if backend == "sqlite":
+        if changed is None or not cached:
+            fps = store.latest_all()
+        else:
+            # Las cartas sin filas nuevas conservan su huella; las cambiadas se recalculan.
+            fps = {card: c.get("fp") for card, c in cached.items()}
+            fps.update((card, None) for card in changed)
+        for card, fp in sorted(fps.items()):
+            c = cached.get(card)
+            if fp is not None and c and c["fp"] == fp and rollups.last_ts(card) is not None:
+                state[card] = c; continue
+            last = store.tail(card, 1)
+            state[card] = {"fp": last[0][0] if last else None, "summary": summarize_store_card(store, card)}
+            rollups.update(card, _card_name(card), *_new_samples(store, card, rollups.last_ts(card)))
+            recomputed += 1
+        if own_store:
+            store.close()
+    else:
+        for path in sorted(glob.glob(os.path.join(DATA_DIR, "*.csv"))):
+            card = os.path.splitext(os.path.basename(path))[0]
+            st = os.stat(path)
+            fp = f"{st.st_mtime_ns}:{st.st_size}"
+            c = cached.get(card)
+            if c and c["fp"] == fp and card not in (changed or ()) and rollups.last_ts(card) is not None:
+                state[card] = c; continue
+            prev = (c or {}).get("summary") or {}
+            state[card] = {"fp": fp, "summary": _with_source(summarize_card(path), sources.get(card) or prev.get("source"))}
+            rollups.update(card, _card_name(card), *_new_samples(None, path, rollups.last_ts(card)))
+            recomputed += 1
+    rollups.save(keep=state)
+    summary = [(card, c["summary"]) for card, c in sorted(state.items()) if c["summary"]]
+
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=FIELDS); w.writeheader()
+    for _, r in summary: w.writerow(r)
+    rows = "\n".join(ROW.substitute(name=html.escape(r["name"]), slug=card, price_now=f"{r['price_now']:.2f}",
+                                    market_now=f"{r['market_now']:.2f}", pct_24h=f"{r['pct_24h']*100:.1f}",
+                                    pct_7d=f"{r['pct_7d']*100:.1f}", breakout="✅" if r["breakout"] else "—",
+                                    source=html.escape(r.get("source") or "—"))
+                     for card, r in summary)
+    written = [name for name, text in (("data.csv", buf.getvalue()), ("index.html", PAGE.substitute(rows=rows)))
+               if write_if_changed(os.path.join(DOCS_DIR, name), text)]
+    write_if_changed(state_file, json.dumps({"version": STATE_VERSION, "backend": backend, "cards": state},
+                                            ensure_ascii=False, separators=(",", ":")))
+    print(f"[panel] {len(summary)} cartas, {recomputed} recalculadas, escritos: {', '.join(written) or 'ninguno'}")
+    return {"cards": len(summary), "recomputed": recomputed, "written": written}
 if __name__ == "__main__":
     build_panel()
@@ -0,0 +1,59 @@
+from statistics import median
+from .collectors.pokemontcg import TCG_VARIANTS, TCG_FIELDS
+
+# Campos de Cardmarket que se guardan como serie propia → atributo de CardRecord.
+CM_FIELDS = {"trendPrice": "cm_trend", "avg1": "cm_avg1", "avg7": "cm_avg7", "avg30": "cm_avg30"}
+# Igual que el precio de siempre, pero sin mezclar variantes ni horizontes en una misma mediana.
+DEFAULT_COMPOSITE = ("tcgplayer.*.market", "cardmarket.avg1", "cardmarket.avg7", "cardmarket.avg30")
+
+def parse_rules(rules=None) -> list:
+    """Valida `prices.composite` del config: "tcgplayer.<variante|*>.<campo>" o "cardmarket.<campo>".
+
+    Devuelve tuplas (fuente, variante, campo); un error de escritura falla al arrancar, no a mitad de corrida.
+    """
+    out = []
+    for rule in rules or DEFAULT_COMPOSITE:
+        parts = str(rule).split(".")
+        if parts[0] == "tcgplayer" and len(parts) == 3 and parts[2] in TCG_FIELDS:
+            out.append(("tcgplayer", parts[1], parts[2]))
+        elif parts[0] == "cardmarket" and len(parts) == 2 and parts[1] in CM_FIELDS:
+            out.append(("cardmarket", None, parts[1]))
+        else:
+            raise ValueError(f"prices.composite: regla desconocida {rule!r} "
+                             f"(tcgplayer.<variante|*>.{'|'.join(TCG_FIELDS)} o cardmarket.{'|'.join(CM_FIELDS)})")
+    return out
+
+def quotes(records) -> list:
+    """[(serie, precio)] de cada CardRecord: "<id>:tcgplayer.<variante>.<campo>" y "<id>:cardmarket.<campo>"."""
+    out = []
+    for r in records:
+        for variant, values in r.tcgplayer.items():
+            out.extend((f"{r.id}:tcgplayer.{variant}.{f}", v) for f, v in zip(TCG_FIELDS, values) if v)
+        out.extend((f"{r.id}:cardmarket.{f}", getattr(r, a)) for f, a in CM_FIELDS.items() if getattr(r, a))
+    return out
+
+def _values(records, source, variant, field):
+    if source == "tcgplayer":
+        i = TCG_FIELDS.index(field)
+        return [r.tcgplayer[variant][i] for r in records if variant in r.tcgplayer and r.tcgplayer[variant][i]]
+    attr = CM_FIELDS[field]
+    return [getattr(r, attr) for r in records if getattr(r, attr)]
+
+def composite(records, rules) -> tuple:
+    """(precio, serie) con la primera regla que tenga datos: mediana de esa serie entre las cartas.
+
+    Con "tcgplayer.*.<campo>" la variante es la primera de TCG_VARIANTS (luego el resto, por
+    nombre) que tenga alguna carta, y sólo se promedian cartas de esa misma variante.
+    Sin datos devuelve (0.0, None).
+    """
+    for source, variant, field in rules:
+        if variant == "*":
+            seen = {v for r in records for v in r.tcgplayer}
+            variants = [v for v in TCG_VARIANTS if v in seen] + sorted(seen.difference(TCG_VARIANTS))
+        else:
+            variants = [variant]
+        for v in variants:
+            vals = _values(records, source, v, field)
+            if vals:
+                return float(median(vals)), f"{source}.{v}.{field}" if v else f"{source}.{field}"
+    return 0.0, None
@@ -0,0 +1,93 @@
+import time, threading, datetime as dt
+from email.utils import parsedate_to_datetime
+
+class TokenBucket:
+    """Token bucket adaptativo, seguro entre hilos.
+
+    `acquire()` reserva un token (si no hay, queda "en deuda" y duerme lo justo),
+    `backoff()` reduce el ritmo a la mitad (y opcionalmente bloquea hasta Retry-After)
+    y `success()` lo recupera de forma aditiva hasta `max_rate`.
+    """
+    def __init__(self, rate: float, burst: float = 1.0, min_rate: float = None):
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate) if min_rate else self.max_rate / 16
+        self.rate = self.max_rate
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "backoffs": 0,
+                      "wait_sec": 0.0, "request_sec": 0.0}
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = max(self.blocked_until - now, -self.tokens / self.rate if self.tokens < 0 else 0.0)
+            self.stats["requests"] += 1
+            self.stats["wait_sec"] += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def record(self, elapsed: float):
+        with self._lock:
+            self.stats["request_sec"] += elapsed
+
+    def success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def backoff(self, retry_after: float = None):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.stats["backoffs"] += 1
+            if retry_after is not None:
+                self.stats["throttled"] += 1
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+                self.tokens = min(self.tokens, 0.0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            out = {k: (round(v, 3) if isinstance(v, float) else v) for k, v in self.stats.items()}
+            out["rate"] = round(self.rate, 3)
+            out["max_rate"] = round(self.max_rate, 3)
+            return out
+
+def parse_retry_after(value, default: float = 1.0) -> float:
+    """Retry-After puede venir en segundos o como fecha HTTP."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - dt.datetime.now(dt.timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+# Un limitador por servicio, compartido por todo el proceso (todos los collectors/hilos).
+_LIMITERS = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def get_limiter(name: str, rate: float, burst: float = 1.0) -> TokenBucket:
+    with _REGISTRY_LOCK:
+        if name not in _LIMITERS:
+            _LIMITERS[name] = TokenBucket(rate, burst)
+        return _LIMITERS[name]
+
+def snapshot() -> dict:
+    with _REGISTRY_LOCK:
+        limiters = dict(_LIMITERS)
+    return {name: lim.snapshot() for name, lim in limiters.items()}
@@ -0,0 +1,158 @@
+import os, json, math
+from collections import deque
+
+DAY = 86400.0
+STATE_VERSION = 2
+
+class CardState:
+    """Agregados incrementales de una carta; cada muestra nueva se integra en O(1) amortizado.
+
+    - `maxq`: deque monótona (precios decrecientes) → máximo de la ventana de breakout_days.
+    - `recent` / `week`: muestras de las últimas 24 h / 7 días separadas al menos `gap`
+      segundos (la última siempre es la más nueva); al caducar dejan el anclaje de 24 h / 7 d
+      (último precio en o antes de now-24h / now-7d). Con muestras separadas ≥ `gap` es el
+      mismo anclaje que signals.score_batch, así Δ24h, Δ7d y breakout coinciden con él; más
+      densas, el anclaje puede adelantarse hasta `gap`. Como mucho 7 d / gap muestras por carta.
+      La media, desviación y volatilidad son EWMA, no la ventana de breakout_days: los filtros
+      zscore_min / vol_spike_min pueden decidir distinto que `python -m src score` o el backtest.
+    - EWMA de precio, varianza y retornos² con constante de tiempo `tau` (segundos).
+    """
+    __slots__ = ("window", "tau", "gap", "maxq", "recent", "week", "anchor_24h", "anchor_7d",
+                 "mean", "var", "ret2", "last_ts", "last_price", "count")
+
+    def __init__(self, window_days: float, tau_days: float = 3.0, gap_sec: float = 3600.0):
+        self.window = window_days * DAY
+        self.tau = tau_days * DAY
+        self.gap = gap_sec
+        self.maxq, self.recent, self.week = deque(), deque(), deque()
+        self.anchor_24h = self.anchor_7d = None
+        self.mean = self.var = self.ret2 = 0.0
+        self.last_ts = self.last_price = None
+        self.count = 0
+
+    def _expire(self, now):
+        while self.maxq and self.maxq[0][0] < now - self.window:
+            self.maxq.popleft()
+        while self.recent and self.recent[0][0] <= now - DAY:
+            self.anchor_24h = self.recent.popleft()
+        while self.week and self.week[0][0] <= now - 7 * DAY:
+            self.anchor_7d = self.week.popleft()
+
+    def _push(self, q, ts, price):
+        # Si la penúltima está a menos de `gap`, la nueva sustituye a la última en vez de sumarse.
+        if len(q) >= 2 and ts - q[-2][0] < self.gap:
+            q[-1] = (ts, price)
+        else:
+            q.append((ts, price))
+
+    def update(self, ts: float, price: float):
+        if self.last_ts is not None and ts <= self.last_ts:
+            return  # muestra repetida o desordenada: el estado sólo avanza
+        self._expire(ts)
+        while self.maxq and self.maxq[-1][1] <= price:
+            self.maxq.pop()
+        self.maxq.append((ts, price))
+        self._push(self.recent, ts, price)
+        self._push(self.week, ts, price)
+
+        if self.count == 0:
+            self.mean, self.var = price, 0.0
+        else:
+            alpha = 1.0 - math.exp(-(ts - self.last_ts) / self.tau)
+            diff = price - self.mean
+            self.mean += alpha * diff
+            self.var = (1.0 - alpha) * (self.var + alpha * diff * diff)
+            if self.last_price and self.last_price > 0:
+                r = price / self.last_price - 1.0
+                self.ret2 += alpha * (r * r - self.ret2)
+        self.last_ts, self.last_price = ts, price
+        self.count += 1
+
+    def features(self, now: float, price_now: float) -> dict:
+        """Agregados vistos desde `now` (antes de integrar la muestra actual)."""
+        self._expire(now)
+        def anchor(a, q):
+            if a: return a[1]
+            return q[0][1] if q else price_now
+        return {"p_24h": anchor(self.anchor_24h, self.recent),
+                "p_7d": anchor(self.anchor_7d, self.week),
+                "rolling_max": self.maxq[0][1] if self.maxq else float("nan"),
+                "mean": self.mean if self.count else price_now,
+                "std": math.sqrt(max(self.var, 0.0)),
+                "vol": math.sqrt(max(self.ret2, 0.0))}
+
+    def to_dict(self) -> dict:
+        return {"maxq": list(self.maxq), "recent": list(self.recent), "week": list(self.week),
+                "anchor_24h": self.anchor_24h, "anchor_7d": self.anchor_7d,
+                "mean": self.mean, "var": self.var, "ret2": self.ret2,
+                "last_ts": self.last_ts, "last_price": self.last_price, "count": self.count}
+
+    @classmethod
+    def from_dict(cls, d: dict, window_days: float, tau_days: float, gap_sec: float = 3600.0):
+        st = cls(window_days, tau_days, gap_sec)
+        st.maxq = deque(tuple(x) for x in d["maxq"])
+        st.recent = deque(tuple(x) for x in d["recent"])
+        st.week = deque(tuple(x) for x in d["week"])
+        st.anchor_24h = tuple(d["anchor_24h"]) if d.get("anchor_24h") else None
+        st.anchor_7d = tuple(d["anchor_7d"]) if d.get("anchor_7d") else None
+        st.mean, st.var, st.ret2 = float(d["mean"]), float(d["var"]), float(d["ret2"])
+        st.last_ts, st.last_price, st.count = d["last_ts"], d["last_price"], int(d["count"])
+        return st
+
+    @classmethod
+    def rebuild(cls, ts, prices, window_days: float, tau_days: float, gap_sec: float = 3600.0):
+        st = cls(window_days, tau_days, gap_sec)
+        for t, p in zip(ts, prices):
+            st.update(float(t), float(p))
+        return st
+
+class SignalStates:
+    """Estados de todas las cartas en un único JSON (data/signal_state.json).
+
+    Si el archivo falta, está corrupto o se generó con otra ventana/tau/gap, se descarta y
+    cada carta se reconstruye desde su historial la próxima vez que se pide.
+    """
+    def __init__(self, path: str, window_days: float, tau_days: float = 3.0, gap_sec: float = 3600.0):
+        self.path = path
+        self.window_days, self.tau_days, self.gap_sec = float(window_days), float(tau_days), float(gap_sec)
+        self.cards = {}
+        self.rebuilt = 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            if (raw.get("version") == STATE_VERSION and raw.get("window_days") == self.window_days
+                    and raw.get("tau_days") == self.tau_days and raw.get("gap_sec") == self.gap_sec):
+                for slug, d in raw.get("cards", {}).items():
+                    try:
+                        self.cards[slug] = CardState.from_dict(d, self.window_days, self.tau_days, self.gap_sec)
+                    except (KeyError, TypeError, ValueError):
+                        print(f"[state] estado corrupto para {slug}, se reconstruirá")
+        except (OSError, ValueError, AttributeError):
+            self.cards = {}
+
+    def get(self, slug: str):
+        return self.cards.get(slug)
+
+    def is_current(self, slug: str, latest_ts) -> bool:
+        """¿El estado incluye la última muestra guardada en el historial?"""
+        st = self.cards.get(slug)
+        if st is None:
+            return False
+        if latest_ts is None:
+            return st.count == 0
+        return st.last_ts is not None and abs(st.last_ts - latest_ts) < 1e-3
+
+    def rebuild(self, slug: str, ts, prices) -> CardState:
+        st = CardState.rebuild(ts, prices, self.window_days, self.tau_days, self.gap_sec)
+        self.cards[slug] = st
+        self.rebuilt += 1
+        return st
+
+    def save(self):
+        out = {"version": STATE_VERSION, "window_days": self.window_days, "tau_days": self.tau_days,
+               "gap_sec": self.gap_sec,
+               "cards": {slug: st.to_dict() for slug, st in sorted(self.cards.items())}}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(out, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
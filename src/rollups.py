@@ -0,0 +1,88 @@
+import os, json
+from .utils import ensure_dir, write_if_changed
+
+# Resolución → (tamaño del bucket en segundos, barras que se conservan; None = todas).
+RESOLUTIONS = {"h": (3600, 14 * 24), "d": (86400, 3 * 366), "w": (7 * 86400, None)}
+WEEK_OFFSET = 4 * 86400  # las semanas empiezan en lunes (1970-01-05)
+INDEX_VERSION = 1
+
+def bucket_start(ts: float, res: str) -> int:
+    size = RESOLUTIONS[res][0]
+    off = WEEK_OFFSET if res == "w" else 0
+    return int((ts - off) // size * size + off)
+
+def merge_bars(bars: list, ts, prices, res: str) -> list:
+    """Integra muestras ordenadas en barras [inicio, open, high, low, close, n]; sólo toca la última."""
+    for t, p in zip(ts, prices):
+        if not p:
+            continue
+        b = bucket_start(t, res)
+        last = bars[-1] if bars else None
+        if last and last[0] == b:
+            last[2], last[3], last[4], last[5] = max(last[2], p), min(last[3], p), p, last[5] + 1
+        elif not last or b > last[0]:
+            bars.append([b, p, p, p, p, 1])
+    keep = RESOLUTIONS[res][1]
+    if keep and len(bars) > keep:
+        del bars[:-keep]
+    return bars
+
+class Rollups:
+    """OHLC + nº de muestras por carta a varias resoluciones, como JSON estático en docs/rollups/.
+
+    - `docs/rollups/<slug>.<h|d|w>.json`: barras de esa resolución (la página pide sólo la del zoom).
+    - `docs/rollups/index.json`: nombre, último ts integrado y nº de muestras por carta.
+
+    Cada corrida añade sólo las muestras posteriores al último ts del índice, así que el
+    coste depende de las filas nuevas y el tamaño de cada archivo está acotado por RESOLUTIONS.
+    """
+    def __init__(self, docs_dir: str):
+        self.dir = os.path.join(docs_dir, "rollups")
+        self.index_path = os.path.join(self.dir, "index.json")
+        self.cards = {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            if raw.get("version") == INDEX_VERSION:
+                self.cards = raw.get("cards", {})
+        except (OSError, ValueError, AttributeError):
+            self.cards = {}
+
+    def last_ts(self, slug: str):
+        return (self.cards.get(slug) or {}).get("last_ts")
+
+    def _path(self, slug, res):
+        return os.path.join(self.dir, f"{slug}.{res}.json")
+
+    def update(self, slug: str, name: str, ts, prices) -> int:
+        """Añade las muestras (ts epoch, precio) posteriores a lo ya integrado. Devuelve cuántas."""
+        last = self.last_ts(slug)
+        new = [(t, round(float(p), 4)) for t, p in zip(ts, prices) if last is None or t > last]
+        if not new:
+            return 0
+        ensure_dir(self.dir)
+        nt, npx = [t for t, _ in new], [p for _, p in new]
+        for res in RESOLUTIONS:
+            bars = []
+            if last is not None:
+                try:
+                    with open(self._path(slug, res), "r", encoding="utf-8") as f:
+                        bars = json.load(f)
+                except (OSError, ValueError):
+                    bars = []
+            merge_bars(bars, nt, npx, res)
+            write_if_changed(self._path(slug, res), json.dumps(bars, separators=(",", ":")))
+        entry = self.cards.setdefault(slug, {"name": name, "last_ts": None, "n": 0})
+        entry.update(name=name, last_ts=nt[-1], n=entry["n"] + len(new))
+        return len(new)
+
+    def save(self, keep=None):
+        if keep is not None:
+            for slug in set(self.cards) - set(keep):
+                del self.cards[slug]
+                for res in RESOLUTIONS:
+                    if os.path.exists(self._path(slug, res)):
+                        os.remove(self._path(slug, res))
+        ensure_dir(self.dir)
+        write_if_changed(self.index_path, json.dumps({"version": INDEX_VERSION, "cards": dict(sorted(self.cards.items()))},
+                                                     ensure_ascii=False, separators=(",", ":")))
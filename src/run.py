@@ -1,19 +1,29 @@
-import os, time, yaml, datetime as dt
-from math import ceil
-from statistics import median
-from .collectors.pokemontcg import fetch_card_entries
-from .signals import price_spike_signal
-from .alerting import send_telegram_text, send_telegram_photo
-from .utils import slugify, ensure_dir, append_history_csv, load_last_n, now_ts
+import os, time, queue, threading
+from functools import partial
+from .collectors.pokemontcg import fetch_card_entries, fetch_watchlist_entries, get_json
+from .collectors.resolve_cache import ResolveCache
+from .collectors.setindex import SetIndex
+from .collectors.httpcache import get_cache as get_http_cache
+from .signals import score_features, cm_filter
+from .rolling import SignalStates
+from .cooldown import AlertIndex
+from .alerting import TelegramDispatcher, build_alert, spike_message
+from .utils import slugify, ensure_dir, append_history_csv, load_window, last_csv_ts, now_ts, iso_to_epoch
 from .health import write_health
+from .panel import build_panel
+from .checkpoint import RunCheckpoint
+from .scheduler import Scheduler
+from . import metrics, prices
+from .ratelimit import snapshot as ratelimit_snapshot
+from .store import open_store, use_sqlite
+from .config import load_config
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
-DOCS_DIR = os.path.join(os.path.dirname(__file__), "..", "docs")
-CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "config.yaml")
+DATA_DIR = os.getenv("PK_DATA_DIR") or os.path.join(os.path.dirname(__file__), "..", "data")
+DOCS_DIR = os.getenv("PK_DOCS_DIR") or os.path.join(os.path.dirname(__file__), "..", "docs")
+CONFIG_FILE = os.getenv("PK_CONFIG") or os.path.join(os.path.dirname(__file__), "..", "config.yaml")
 
 def load_cfg():
-    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+    return load_config(CONFIG_FILE)
 
 def augment_queries(base_queries, min_grade=None, language=None, include_terms=None):
     q = list(base_queries)
@@ -26,151 +36,421 @@ def augment_queries(base_queries, min_grade=None, language=None, include_terms=N
         elif "PSA9" in mg or "PSA 9" in mg: include_terms.append('"PSA 9"')
     return q, include_terms
 
+def _error_item(name, msg):
+    return {"name": name, "entries": 0, "price_now": 0.0, "pct_24h": 0.0, "pct_7d": 0.0,
+            "breakout": False, "alerted": False, "note": msg}
+
+def fetch_item(item, cfg, ctx):
+    """Fase de red de una carta: precio actual + ventana de historial. Corre en un hilo del pool."""
+    if ctx["deadline"] and time.time() > ctx["deadline"]:
+        return None
+    name = item["name"]
+    t0 = time.time()
+    try:
+        base_queries = item["queries"]
+        min_grade = item.get("min_grade")
+        language = item.get("language")
+        include_terms = item.get("include_terms", [])
+        queries, _ = augment_queries(base_queries, min_grade, language, include_terms)
+
+        print(f"[watch] {name}")
+        entries = ctx["prefetched"].pop(name, None)
+        if entries is None:
+            entries = fetch_card_entries(queries, api_key=ctx["api_key"], max_cards=2, cache=ctx["resolve_cache"],
+                                         index=ctx["set_index"])
+        print(f"[{name}] entries={len(entries)} samples={[e.now for e in entries][:3]}")
+
+        # `entries` son CardRecord. El precio compuesto sale de una sola serie (prices.composite
+        # del config) y todas las series por fuente/variante se guardan aparte.
+        p_market_now, source = prices.composite(entries, ctx["price_rules"])
+
+        # Cardmarket de la primera entrada que lo tenga: se guarda para poder re-jugar
+        # los filtros de tendencia/avg7 en el backtest.
+        cm_row = next((e.cm for e in entries if e.has_cardmarket), (None, None, None))
+
+        slug = slugify(name)
+        # El historial sólo se lee si el estado incremental de la carta falta o va por detrás.
+        fname = os.path.join(DATA_DIR, f"{slug}.csv")
+        latest = ctx["store"].latest_ts(slug) if ctx["store"] else last_csv_ts(fname)
+        history = None
+        if not ctx["states"].is_current(slug, latest):
+            # La ventana cubre el anclaje de 7d aunque breakout_days sea menor.
+            days = max(cfg["thresholds"]["breakout_days"], 7) + 1
+            with metrics.timer("history.load"):
+                history = ctx["store"].window(slug, days) if ctx["store"] else load_window(fname, days)
+        ts = now_ts()
+        metrics.observe("stage.fetch_item", time.time() - t0, kind="timer")
+        return {"error": None, "name": name, "slug": slug, "queries": queries, "entries": entries,
+                "price_now": p_market_now, "market_now": p_market_now, "ts": ts,
+                "cm": cm_row, "price_source": source, "quotes": prices.quotes(entries),
+                "history": history, "fetch_sec": time.time() - t0}
+
+    except Exception as e:
+        msg = f"{type(e).__name__}: {str(e)[:200]}"
+        print(f"[{name}] ERROR (continuo con la siguiente):", msg)
+        return {"error": msg, "error_kind": metrics.classify_error(e), "name": name, "fetch_sec": time.time() - t0}
+
+def normalize_item(res, ctx):
+    """Reduce las `entries` de una carta a lo que usan la alerta y `stats` (imagen, filtros
+    Cardmarket y cuántas había) para no arrastrar los CardRecord por el pipeline."""
+    entries = res.pop("entries")
+    use_trend, min_avg7 = ctx["use_trend"], ctx["min_avg7"]
+    res["n_entries"] = len(entries)
+    res["image_url"] = next((e.image_large for e in entries if e.image_large), None)
+
+    trend_ok = True
+    avg7_ok = True
+    if (use_trend or min_avg7 > 0) and entries:
+        trend_ok = False; avg7_ok = False
+        for e in entries:
+            if e.has_cardmarket and cm_filter(*e.cm, use_trend, min_avg7):
+                trend_ok, avg7_ok = True, True; break
+    res["trend_ok"], res["avg7_ok"] = trend_ok, avg7_ok
+    return res
+
+def alert_item(res, meta, ctx):
+    """Cooldown + alerta de una carta ya normalizada y puntuada. Devuelve el item para `stats`."""
+    name, queries, image_url = res["name"], res["queries"], res["image_url"]
+    price_now = res["price_now"]
+    trend_ok, avg7_ok = res["trend_ok"], res["avg7_ok"]
+    ok = meta["ok"]
+
+    if ctx["force_test"]:
+        ok = True; meta = {**meta, "pct_24h": 0.25, "pct_7d": 0.40, "breakout": True}
+
+    alerted = False
+    note = "" if price_now else "sin precio"
+    fire = ok and trend_ok and avg7_ok and price_now > 0
+    # Las alertas de prueba (FORCE_TEST_ALERT) no pasan por el cooldown ni lo anotan.
+    key, signal = res["slug"], (res["epoch"], price_now, meta["pct_24h"], meta["pct_7d"])
+    if fire and not ctx["force_test"] and not ctx["alert_index"].should_alert(key, *signal):
+        print(f"[{name}] alerta omitida: en cooldown y sin escalada")
+        fire, note = False, "cooldown"
+    if fire:
+        title, body = spike_message(name, meta, price_now, res["price_source"], queries)
+        # No bloquea: el dispatcher envía en segundo plano (foto + texto en una sola llamada).
+        ctx["dispatcher"].submit(build_alert("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", title, body,
+                                             image_url if ctx["send_images"] else None,
+                                             cooldown=None if ctx["force_test"] else {"key": key, "signal": signal}))
+        alerted = True
+    elif note != "cooldown":
+        print(f"[{name}] no alert: ok={ok}, trend_ok={trend_ok}, avg7_ok={avg7_ok}, now=${price_now:.2f}")
+
+    return {
+        "name": name,
+        "entries": res["n_entries"],
+        "price_now": float(price_now or 0),
+        "pct_24h": float(meta.get("pct_24h",0)),
+        "pct_7d": float(meta.get("pct_7d",0)),
+        "breakout": bool(meta.get("breakout", False)),
+        "zscore": round(float(meta.get("zscore",0)), 3),
+        "vol_spike": round(float(meta.get("vol_spike",0)), 3),
+        "alerted": alerted,
+        "source": res["price_source"],
+        "note": note
+    }
+
+_DONE = object()
+# Tipo de error (metrics.classify_error) → contador de `stats`.
+ERROR_COUNTERS = {"timeout": "timeouts", "net": "net_errors", "parse": "parse_errors"}
+
+def collect(watch, cfg, ctx, concurrency, maxsize):
+    """Etapa 1 (hilos): red + historial de cada carta, entregados según terminan.
+
+    La cola de salida está acotada: si las etapas siguientes van por detrás, los hilos se
+    bloquean en `put` en vez de acumular resultados en memoria.
+    """
+    todo, out = queue.Queue(), queue.Queue(maxsize=maxsize)
+    for it in watch:
+        todo.put(it)
+    def worker():
+        while True:
+            try:
+                it = todo.get_nowait()
+            except queue.Empty:
+                return
+            out.put(fetch_item(it, cfg, ctx))
+    workers = [threading.Thread(target=worker, name=f"collector-{i}", daemon=True) for i in range(concurrency)]
+    for t in workers:
+        t.start()
+    def closer():
+        for t in workers:
+            t.join()
+        out.put(_DONE)
+    threading.Thread(target=closer, name="collector-closer", daemon=True).start()
+    while True:
+        res = out.get()
+        if res is _DONE:
+            return
+        yield res
+
+def normalize(results, ctx):
+    """Etapa 2: normaliza las cartas descargadas; errores y saltadas (None) pasan tal cual."""
+    for res in results:
+        if res and not res["error"]:
+            normalize_item(res, ctx)
+        yield res
+
+def chunked(results, size):
+    chunk = []
+    for res in results:
+        chunk.append(res)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _in_threshold_units(value, threshold):
+    # Un umbral en 0 (filtro desactivado) no aporta prioridad: nunca debe cortar la corrida.
+    return value / threshold if threshold and threshold > 0 else 0.0
+
+def process_chunk(chunk, cfg, ctx):
+    """Etapas 3-5 para un bloque: señales vectorizadas, alertas y escritura del historial.
+
+    Devuelve (nombres terminados, items de `stats`, contadores, slugs con filas nuevas, saltadas).
+    """
+    states = ctx["states"]
+    fetched = [res for res in chunk if res and not res["error"]]
+    feats = []
+    for res in fetched:
+        if res["history"] is not None:
+            states.rebuild(res["slug"], *res["history"])
+        res["history"] = None
+        res["epoch"] = iso_to_epoch(res["ts"])
+        feats.append(states.get(res["slug"]).features(res["epoch"], res["price_now"]))
+    with metrics.timer("signals.score"):
+        metas = score_features([res["price_now"] for res in fetched],
+                               *([f[k] for f in feats] for k in ("p_24h", "p_7d", "rolling_max", "mean", "std", "vol")),
+                               cfg=cfg) if fetched else []
+    meta_by_name = {res["name"]: m for res, m in zip(fetched, metas)}
+
+    done, items, skipped = [], [], 0
+    counters = {"processed": 0, "timeouts": 0, "net_errors": 0, "parse_errors": 0, "alerts_sent": 0}
+    for res in chunk:
+        if res is None:
+            skipped += 1; continue
+        counters["processed"] += 1
+        done.append(res["name"])
+        msg = res["error"]
+        if msg:
+            kind = ERROR_COUNTERS.get(res["error_kind"])
+            if kind:
+                counters[kind] += 1
+            metrics.incr(f"errors.{res['error_kind']}")
+            items.append(_error_item(res["name"], msg))
+            ctx["scheduler"].observe(res["name"], time.time(), res["fetch_sec"], ok=False)
+            continue
+        meta = meta_by_name[res["name"]]
+        # Para el scheduler: volatilidad y cercanía a los umbrales, en unidades de umbral (0..1).
+        th = cfg["thresholds"]
+        ctx["scheduler"].observe(res["name"], time.time(), res["fetch_sec"], ok=True,
+                                 volatility=_in_threshold_units(meta.get("volatility", 0.0), th["pct_24h"]),
+                                 proximity=max(_in_threshold_units(meta["pct_24h"], th["pct_24h"]),
+                                               _in_threshold_units(meta["pct_7d"], th["pct_7d"])))
+        try:
+            with metrics.timer("alert.evaluate"):
+                item = alert_item(res, meta, ctx)
+        except Exception as e:
+            msg = f"{type(e).__name__}: {str(e)[:200]}"
+            print(f"[{res['name']}] ERROR (continuo con la siguiente):", msg)
+            item = _error_item(res["name"], msg)
+        if item["alerted"]:
+            counters["alerts_sent"] += 1
+        items.append(item)
+
+    # Una transacción por bloque (historial + series por fuente): lo escrito sobrevive
+    # aunque la corrida se corte después.
+    with metrics.timer("history.append"):
+        if ctx["store"]:
+            ctx["store"].append_many(((res["slug"], res["ts"], res["price_now"], res["market_now"], *res["cm"],
+                                       res["price_source"]) for res in fetched),
+                                     quotes=((res["slug"], series, res["ts"], price)
+                                             for res in fetched for series, price in res["quotes"]))
+        else:
+            for res in fetched:
+                append_history_csv(os.path.join(DATA_DIR, f"{res['slug']}.csv"),
+                                   {"ts": res["ts"], "price_now": res["price_now"], "market_now": res["market_now"]},
+                                   fieldnames=["ts","price_now","market_now"])
+    # El estado se actualiza después del historial y se guarda al final: si la corrida muere
+    # entre medias, la próxima ve que va por detrás y lo reconstruye.
+    for res in fetched:
+        states.get(res["slug"]).update(res["epoch"], res["price_now"])
+        ctx["price_sources"][res["slug"]] = res.pop("price_source")
+        res.pop("quotes")
+    if counters["alerts_sent"]:
+        ctx["alert_index"].save(time.time())
+    return done, items, counters, [res["slug"] for res in fetched], skipped
+
 def main():
     cfg = load_cfg()
     ensure_dir(DATA_DIR); ensure_dir(DOCS_DIR)
 
-    pokemontcg_key = os.getenv(cfg["sources"]["pokemontcg"]["api_key_env"], "")
-    use_trend = cfg.get("run", {}).get("use_cardmarket_trend", True)
-    min_avg7 = cfg["thresholds"].get("min_avg7_usd", 0)
-
+    alert_cfg = cfg.get("alerting", {})
+    alert_index = AlertIndex(os.path.join(DATA_DIR, "alert_state.json"),
+                             cooldown_hours=float(os.getenv("ALERT_COOLDOWN_HOURS", alert_cfg.get("cooldown_hours", 24))),
+                             step=float(alert_cfg.get("escalation_pct", 0.05)))
+    # Arranca reintentando lo que quedó en el outbox de corridas anteriores; el cooldown de
+    # cada alerta se anota cuando Telegram la acepta.
+    dispatcher = TelegramDispatcher(os.path.join(DATA_DIR, "outbox.jsonl"), on_sent=alert_index.delivered).start()
     if os.getenv("SEND_PING","false").lower() in ("1","true","yes"):
-        send_telegram_text("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", "🤖 Bot iniciado (healthcheck).")
+        dispatcher.submit(build_alert("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", "🤖 Bot iniciado", "healthcheck"))
 
     MAX_RUNTIME = float(os.getenv("MAX_RUNTIME_SEC", "0"))
     start_time = time.time()
     batch_size = int(os.getenv("WATCH_BATCH_SIZE", "0"))
+    concurrency = max(1, int(os.getenv("WATCH_CONCURRENCY", "1")))
+    flush_every = max(1, int(os.getenv("PIPELINE_FLUSH", "25")))
     full_watch = list(cfg["watchlist"])
-    watch = list(full_watch)
-    if batch_size and batch_size < len(watch):
-        chunks = ceil(len(watch) / batch_size)
-        slot = dt.datetime.utcnow().hour % max(chunks, 1)
-        start = slot * batch_size
-        end = min(len(watch), start + batch_size)
-        print(f"[batch] Procesando cartas {start}..{end-1} de {len(watch)}")
-        watch = watch[start:end]
+    by_name = {it["name"]: it for it in full_watch}
+    checkpoint = RunCheckpoint(os.path.join(DATA_DIR, "checkpoint.jsonl"))
+    scheduler = Scheduler(os.path.join(DATA_DIR, "schedule.json"),
+                          max_interval_hours=float(os.getenv("SCHEDULE_MAX_INTERVAL_HOURS", "24")))
+    # Si una corrida anterior quedó a medias, se terminan sus cartas antes de elegir otro lote.
+    watch = [by_name[n] for n in checkpoint.pending() if n in by_name] if checkpoint.resume() else []
+    if watch:
+        print(f"[checkpoint] Retomando {len(watch)} cartas pendientes ({len(checkpoint.done)} ya hechas)")
+    else:
+        # Lote por prioridad (antigüedad, volatilidad, cercanía a umbral) ajustado a
+        # WATCH_BATCH_SIZE y al 80% de MAX_RUNTIME_SEC según la latencia medida.
+        watch = scheduler.pick(full_watch, time.time(), batch_size=batch_size,
+                               budget_sec=0.8 * MAX_RUNTIME, concurrency=concurrency)
+        print(f"[schedule] {len(watch)} de {len(full_watch)} cartas: {scheduler.last_pick}")
+        checkpoint.start([it["name"] for it in watch])
 
-    force_test = os.getenv("FORCE_TEST_ALERT","false").lower() in ("1","true","yes")
+    ctx = {
+        "api_key": os.getenv(cfg["sources"]["pokemontcg"]["api_key_env"], ""),
+        "use_trend": cfg.get("run", {}).get("use_cardmarket_trend", True),
+        "min_avg7": cfg["thresholds"].get("min_avg7_usd", 0),
+        "force_test": os.getenv("FORCE_TEST_ALERT","false").lower() in ("1","true","yes"),
+        "send_images": cfg.get("run", {}).get("send_images", True),
+        "dispatcher": dispatcher,
+        "scheduler": scheduler,
+        "alert_index": alert_index,
+        # El watchdog se evalúa al empezar cada carta: las que ya estaban en vuelo terminan.
+        "deadline": start_time + MAX_RUNTIME if MAX_RUNTIME else 0.0,
+        "resolve_cache": None,
+        "set_index": None,
+        "prefetched": {},
+        "price_rules": prices.parse_rules((cfg.get("prices") or {}).get("composite")),
+        "price_sources": {},
+        # Con SQLite las filas nuevas de cada bloque del pipeline van en una transacción.
+        "store": open_store(DATA_DIR) if use_sqlite() else None,
+        "states": SignalStates(os.path.join(DATA_DIR, "signal_state.json"), cfg["thresholds"]["breakout_days"],
+                               tau_days=float(os.getenv("SIGNAL_EWMA_DAYS", "3")),
+                               gap_sec=60 * float(os.getenv("SIGNAL_ANCHOR_GAP_MIN", "60"))),
+    }
+    if os.getenv("SET_INDEX", "true").lower() in ("1","true","yes"):
+        # Sets y nombres de /v2/sets: las queries se resuelven a set.id + número en local.
+        ctx["set_index"] = SetIndex(os.path.join(DATA_DIR, "set_index.json"), partial(get_json, api_key=ctx["api_key"]),
+                                    ttl_hours=float(os.getenv("SET_INDEX_TTL_HOURS", "168")))
+    batched_cards = 0
+    if os.getenv("RESOLVE_CACHE", "true").lower() in ("1","true","yes"):
+        ctx["resolve_cache"] = ResolveCache(os.path.join(DATA_DIR, "resolve_cache.json"),
+                                            ttl_hours=float(os.getenv("RESOLVE_CACHE_TTL_HOURS", "168")))
+        # Las cartas ya resueltas se piden juntas por ID en unas pocas peticiones;
+        # el resto (nuevas, caducadas o de un lote fallido) se buscan carta a carta en el pool.
+        watch_queries = {}
+        for it in watch:
+            qs, _ = augment_queries(it["queries"], it.get("min_grade"), it.get("language"), list(it.get("include_terms", [])))
+            watch_queries[it["name"]] = qs
+        try:
+            ctx["prefetched"], _ = fetch_watchlist_entries(watch_queries, api_key=ctx["api_key"],
+                                                           max_cards=2, cache=ctx["resolve_cache"],
+                                                           index=ctx["set_index"])
+            batched_cards = len(ctx["prefetched"])
+        except Exception as e:
+            print("[batch] ERROR en la descarga por lotes, sigo carta a carta:", type(e).__name__, str(e)[:200])
 
     stats = {
         "started": now_ts(),
         "duration_sec": 0.0,
         "cards_total": len(full_watch),
-        "batch_size": batch_size or len(full_watch),
+        "batch_size": len(checkpoint.order),
+        "concurrency": concurrency,
+        "resumed": len(checkpoint.done),
         "processed": 0,
         "timeouts": 0,
         "net_errors": 0,
         "parse_errors": 0,
         "alerts_sent": 0,
-        "items": []
     }
 
-    for item in watch:
-        if MAX_RUNTIME and (time.time() - start_time) > MAX_RUNTIME:
-            print("[watchdog] Tiempo máximo alcanzado, detengo el loop."); break
-        name = item["name"]
-        try:
-            base_queries = item["queries"]
-            min_grade = item.get("min_grade")
-            language = item.get("language")
-            include_terms = item.get("include_terms", [])
-            queries, _ = augment_queries(base_queries, min_grade, language, include_terms)
-
-            print(f"[watch] {name}")
-            entries = fetch_card_entries(queries, api_key=pokemontcg_key, max_cards=2)
-            print(f"[{name}] entries={len(entries)} samples={[e.get('now') for e in entries][:3]}")
-
-            market_candidates = [e["now"] for e in entries if e.get("now") is not None]
-            p_market_now = median(market_candidates) if market_candidates else 0.0
-            if p_market_now == 0.0:
-                cm_values = []
-                for e in entries:
-                    cm = (e.get("cardmarket") or {}).get("prices") if isinstance(e, dict) else None
-                    if cm:
-                        for k in ("avg1","avg7","avg30"):
-                            if cm.get(k): cm_values.append(cm[k])
-                p_market_now = median(cm_values) if cm_values else 0.0
-
-            image_url = None
-            for e in entries:
-                if e.get("image_large"): image_url = e["image_large"]; break
-
-            price_now = p_market_now
-            fname = os.path.join(DATA_DIR, f"{slugify(name)}.csv")
-            last_prices = load_last_n(fname, cfg["thresholds"]["breakout_days"])
-            p_24h = last_prices[-1] if last_prices else price_now
-            p_7d  = last_prices[0]  if last_prices else price_now
-
-            append_history_csv(fname, {"ts": now_ts(), "price_now": price_now, "market_now": p_market_now},
-                               fieldnames=["ts","price_now","market_now"])
-
-            ok, meta = price_spike_signal({"now": price_now, "24h_ago": p_24h, "7d_ago": p_7d}, last_prices, cfg)
-
-            trend_ok = True
-            avg7_ok = True
-            if (use_trend or min_avg7 > 0) and entries:
-                trend_ok = False; avg7_ok = False
-                for e in entries:
-                    cm = (e.get("cardmarket") or {}).get("prices") if isinstance(e, dict) else None
-                    if not cm: continue
-                    t_ok = (cm.get("avg1",0) >= cm.get("avg7",0) >= cm.get("avg30",0)) if use_trend else True
-                    a_ok = (cm.get("avg7",0) >= min_avg7) if min_avg7>0 else True
-                    if t_ok and a_ok:
-                        trend_ok, avg7_ok = True, True; break
-
-            if force_test:
-                ok = True; meta = {"pct_24h": 0.25, "pct_7d": 0.40, "breakout": True}
-
-            alerted = False
-            if ok and trend_ok and avg7_ok and price_now > 0:
-                title = f"📈 Spike: {name}"
-                body = (f"Δ24h: {meta['pct_24h']*100:.1f}% | Δ7d: {meta['pct_7d']*100:.1f}% | breakout: {meta['breakout']}"
-                        f"Ahora: ${price_now:.2f} (PokémonTCG/CM)"
-                        f"Queries: {', '.join(queries)}")
-                if image_url:
-                    send_telegram_photo("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", image_url, caption=f"<b>{title}</b>")
-                    send_telegram_text("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", body)
-                else:
-                    send_telegram_text("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", f"<b>{title}</b>\n{body}")
-                alerted = True; stats["alerts_sent"] += 1
-            else:
-                print(f"no alert: ok={ok}, trend_ok={trend_ok}, avg7_ok={avg7_ok}, now=${price_now:.2f}")
-
-            stats["processed"] += 1
-            stats["items"].append({
-                "name": name,
-                "entries": len(entries),
-                "price_now": float(price_now or 0),
-                "pct_24h": float(meta.get("pct_24h",0)) if isinstance(meta, dict) else 0.0,
-                "pct_7d": float(meta.get("pct_7d",0)) if isinstance(meta, dict) else 0.0,
-                "breakout": bool(meta.get("breakout", False)) if isinstance(meta, dict) else False,
-                "alerted": alerted,
-                "note": "" if price_now else "sin precio"
-            })
+    # Pipeline: collector (hilos) → normalizer → [scorer → alertas → historial] por bloques
+    # de PIPELINE_FLUSH cartas → dispatcher de Telegram (hilo propio). Cada bloque se anota
+    # en el checkpoint en cuanto su historial está escrito.
+    print(f"[run] {len(watch)} cartas con concurrencia={concurrency}")
+    changed, skipped = {slugify(n) for n in checkpoint.done}, 0
+    for chunk in chunked(normalize(collect(watch, cfg, ctx, concurrency, maxsize=2 * flush_every), ctx), flush_every):
+        done, items, counters, slugs, n_skipped = process_chunk(chunk, cfg, ctx)
+        checkpoint.mark(done, items, counters)
+        changed.update(slugs)
+        skipped += n_skipped
+    if skipped:
+        print(f"[watchdog] Tiempo máximo alcanzado, {skipped} cartas quedan para la próxima corrida.")
+    for k, v in checkpoint.counters.items():
+        stats[k] = v
 
-        except Exception as e:
-            msg = f"{type(e).__name__}: {str(e)[:200]}"
-            stats["processed"] += 1
-            if "Timeout" in msg or "Read timed out" in msg:
-                stats["timeouts"] += 1
-            elif "network" in msg.lower() or "connection" in msg.lower():
-                stats["net_errors"] += 1
-            elif "parse" in msg.lower() or "JSONDecodeError" in msg:
-                stats["parse_errors"] += 1
-            stats["items"].append({
-                "name": name,
-                "entries": 0,
-                "price_now": 0.0,
-                "pct_24h": 0.0,
-                "pct_7d": 0.0,
-                "breakout": False,
-                "alerted": False,
-                "note": msg
-            })
-            print(f"[{name}] ERROR (continuo con la siguiente):", msg); continue
+    # Panel con el store ya abierto: sólo se recalculan las cartas con filas nuevas.
+    try:
+        with metrics.timer("panel.build"):
+            stats["panel"] = build_panel(store=ctx["store"], changed=changed, sources=ctx["price_sources"])
+    except Exception as e:
+        print("[panel] ERROR:", type(e).__name__, str(e)[:200])
+    if ctx["store"]:
+        # history.sqlite no va a git: lo nuevo se copia a data/<slug>.csv, que sí se commitea.
+        if os.getenv("HISTORY_CSV_EXPORT", "true").lower() in ("1","true","yes"):
+            with metrics.timer("history.export"):
+                stats["csv_exported"] = ctx["store"].export_csvs(DATA_DIR)
+        ctx["store"].close()
+    states = ctx["states"]
+    states.save()
+    stats["signal_state"] = {"cards": len(states.cards), "rebuilt": states.rebuilt}
+    scheduler.save(keep=by_name)
+    stats["schedule"] = scheduler.last_pick
+
+    cache = ctx["resolve_cache"]
+    if cache:
+        all_queries = set()
+        for it in full_watch:
+            qs, _ = augment_queries(it["queries"], it.get("min_grade"), it.get("language"), list(it.get("include_terms", [])))
+            all_queries.update(qs)
+        cache.save(keep=all_queries)
+        stats["resolve_cache"] = cache.stats()
+        stats["batched_cards"] = batched_cards
 
+    if ctx["set_index"]:
+        ctx["set_index"].save()
+        stats["set_index"] = ctx["set_index"].stats()
+
+    # Primero se vacía el dispatcher: las alertas que confirme aún entran en el cooldown.
+    stats["telegram"] = dispatcher.close(timeout=float(os.getenv("ALERT_DRAIN_SEC", "60")))
+    alert_index.save(time.time())
+    stats["alert_cooldown"] = alert_index.stats()
     stats["duration_sec"] = round(time.time() - start_time, 3)
-    write_health(stats)
+    stats["ratelimit"] = ratelimit_snapshot()
+    stats["metrics"] = metrics.snapshot()
+    if get_http_cache():
+        stats["http_cache"] = get_http_cache().stats()
+    # Los items de cada carta se releen del checkpoint al escribir health/status.
+    write_health(stats, items=checkpoint.iter_items())
+    checkpoint.close(finished=not skipped)
+
+def main_profiled():
+    # RUN_PROFILE=1 (o una ruta) guarda un perfil cProfile de la corrida, por defecto en .cache/run.pstats.
+    profile_to = os.getenv("RUN_PROFILE", "")
+    if profile_to and profile_to.lower() not in ("0", "false", "no"):
+        import cProfile, pstats
+        if profile_to.lower() in ("1", "true", "yes"):
+            profile_to = os.path.join(os.path.dirname(__file__), "..", ".cache", "run.pstats")
+        ensure_dir(os.path.dirname(os.path.abspath(profile_to)))
+        prof = cProfile.Profile()
+        prof.runcall(main)
+        prof.dump_stats(profile_to)
+        pstats.Stats(prof).sort_stats("cumulative").print_stats(20)
+        print(f"[profile] guardado en {profile_to}")
+    else:
+        main()
 
 if __name__ == "__main__":
-    main()
+    main_profiled()
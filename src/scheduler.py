@@ -0,0 +1,86 @@
+import os, json, math
+
+HOUR = 3600.0
+
+class Scheduler:
+    """Elige el lote de cada corrida en vez del slot `utcnow().hour % chunks`.
+
+    Por carta se guarda (data/schedule.json) cuándo se refrescó por última vez, la latencia
+    media de su descarga, su volatilidad y lo cerca que quedó de un umbral de alerta.
+    Prioridad = antigüedad / max_interval × (1 + hot_weight × (volatilidad + proximidad)):
+    las cartas calientes suben antes, y cualquier carta que pase de `max_interval` horas
+    sin refrescar va por delante de todas las demás.
+    """
+    def __init__(self, path: str, max_interval_hours: float = 24.0, hot_weight: float = 2.0):
+        self.path = path
+        self.max_interval = max_interval_hours * HOUR
+        self.hot_weight = hot_weight
+        self.last_pick = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.cards = json.load(f)
+            if not isinstance(self.cards, dict):
+                self.cards = {}
+        except (OSError, ValueError):
+            self.cards = {}
+
+    def _latency(self, name, default):
+        return (self.cards.get(name) or {}).get("latency") or default
+
+    def priority(self, name: str, now: float) -> float:
+        c = self.cards.get(name)
+        if not c or not c.get("last_fetched"):
+            return math.inf
+        urgency = (now - c["last_fetched"]) / self.max_interval
+        if urgency >= 1.0:
+            return 1e6 + urgency  # vencida: antes que cualquier carta al día
+        return urgency * (1.0 + self.hot_weight * (c.get("volatility", 0.0) + c.get("proximity", 0.0)))
+
+    def pick(self, watch: list, now: float, batch_size: int = 0, budget_sec: float = 0.0, concurrency: int = 1):
+        """Cartas de `watch` por prioridad, hasta `batch_size` y lo que quepa en `budget_sec`.
+
+        El presupuesto se estima con la latencia medida de cada carta repartida entre los
+        hilos; las cartas sin medir usan la mediana de las conocidas.
+        """
+        known = sorted(c["latency"] for c in self.cards.values() if c.get("latency"))
+        default = known[len(known) // 2] if known else 2.0
+        ranked = sorted(watch, key=lambda it: -self.priority(it["name"], now))
+        out, est = [], 0.0
+        for it in ranked:
+            if batch_size and len(out) >= batch_size:
+                break
+            cost = self._latency(it["name"], default) / max(concurrency, 1)
+            if budget_sec and out and est + cost > budget_sec:
+                break
+            out.append(it); est += cost
+        overdue = [it for it in watch if self.priority(it["name"], now) >= 1e6]
+        left = [it for it in overdue if it not in out]
+        if left:
+            print(f"[schedule] WARN: {len(left)} cartas vencidas no caben en este lote "
+                  f"(sube WATCH_BATCH_SIZE/MAX_RUNTIME_SEC o SCHEDULE_MAX_INTERVAL_HOURS)")
+        stale = [now - self.cards[it["name"]]["last_fetched"] for it in watch
+                 if (self.cards.get(it["name"]) or {}).get("last_fetched")]
+        self.last_pick = {"picked": len(out), "overdue": len(overdue), "est_sec": round(est, 2),
+                          "max_staleness_h": round(max(stale) / HOUR, 2) if stale else None}
+        return out
+
+    def observe(self, name: str, now: float, latency: float, ok: bool, volatility: float = 0.0,
+                proximity: float = 0.0, alpha: float = 0.3):
+        c = self.cards.setdefault(name, {})
+        prev = c.get("latency")
+        c["latency"] = round(latency if prev is None else prev + alpha * (latency - prev), 3)
+        if ok:
+            c["last_fetched"] = round(now, 1)
+            c["volatility"] = round(min(max(volatility, 0.0), 1.0), 4)
+            c["proximity"] = round(min(max(proximity, 0.0), 1.0), 4)
+            c["fails"] = 0
+        else:
+            c["fails"] = c.get("fails", 0) + 1
+
+    def save(self, keep=None):
+        if keep is not None:
+            self.cards = {k: v for k, v in self.cards.items() if k in keep}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(self.cards.items())), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
@@ -0,0 +1,61 @@
+import os, glob, datetime as dt
+from .signals import score_batch, cm_filter
+from .store import HistoryStore, use_sqlite
+from .utils import slugify, iso_to_epoch, load_window, last_csv_ts
+
+DATA_DIR = os.getenv("PK_DATA_DIR") or os.path.join(os.path.dirname(__file__), "..", "data")
+
+def _card_name(card):
+    return card.replace("-", " ").title()
+
+def _load(data_dir, days):
+    """[(card, última fila, ts/precios anteriores dentro de `days` días)] desde SQLite o los CSV."""
+    out = []
+    db_file = os.path.join(data_dir, "history.sqlite")
+    if use_sqlite() and os.path.exists(db_file):
+        store = HistoryStore(db_file)
+        for card, (ts, price, a1, a7, a30, source) in sorted(store.last_rows().items()):
+            since = (dt.datetime.fromisoformat(ts) - dt.timedelta(days=days)).isoformat()
+            rows = store.range(card, since=since, until=ts)
+            out.append((card, (iso_to_epoch(ts), float(price or 0), (a1, a7, a30), source),
+                        ([iso_to_epoch(t) for t, _, _ in rows], [float(p or 0) for _, p, _ in rows])))
+        store.close()
+        return out
+    now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc).timestamp()
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+        last = last_csv_ts(path)
+        if last is None:
+            continue
+        ts, px = load_window(path, (now - last) / 86400.0 + days, max_rows=10**6)
+        if not len(ts):
+            continue
+        # Los CSV no guardan Cardmarket ni la fuente del precio.
+        out.append((os.path.splitext(os.path.basename(path))[0], (ts[-1], px[-1], (None, None, None), None),
+                    (list(ts[:-1]), list(px[:-1]))))
+    return out
+
+def evaluate(cfg: dict, data_dir: str = DATA_DIR) -> list:
+    """Señales de la última muestra guardada de cada carta del watchlist, sin red ni Telegram.
+
+    Recalcula los agregados desde la ventana anterior a esa muestra con signals.score_batch
+    (la corrida los lleva en el estado incremental de rolling.CardState; ambos acaban en
+    score_features). Δ24h, Δ7d y breakout coinciden con la corrida; media, desviación y
+    volatilidad son de la ventana y no EWMA, así que con zscore_min / vol_spike_min el
+    resultado puede diferir. Los filtros Cardmarket usan las columnas cm_avg* de esa fila
+    (como el backtest: sin datos Cardmarket el filtro no pasa). Sirve para ver qué alertaría
+    un cambio de umbrales en config.yaml antes de la próxima corrida.
+    """
+    th, run_cfg = cfg["thresholds"], cfg.get("run", {})
+    use_trend, min_avg7 = run_cfg.get("use_cardmarket_trend", True), th.get("min_avg7_usd", 0) or 0
+    names = {slugify(it["name"]): it["name"] for it in cfg.get("watchlist", [])}
+    loaded = [c for c in _load(data_dir, max(th["breakout_days"], 7) + 1) if not names or c[0] in names]
+    metas = score_batch([series for _, _, series in loaded], [last[1] for _, last, _ in loaded],
+                        [last[0] for _, last, _ in loaded], cfg)
+    out = []
+    for (card, (epoch, price, (a1, a7, a30), source), _), meta in zip(loaded, metas):
+        cm_ok = True
+        if use_trend or min_avg7 > 0:
+            cm_ok = any(v is not None for v in (a1, a7, a30)) and cm_filter(a1, a7, a30, use_trend, min_avg7)
+        out.append({"card": card, "name": names.get(card) or _card_name(card), "epoch": epoch, "price_now": price,
+                    "source": source, "cm_ok": cm_ok, "would_alert": meta["ok"] and cm_ok and price > 0, **meta})
+    return out
@@ -1,20 +1,107 @@
+import numpy as np
 from typing import Dict, Any, List
-def compute_deltas(now: float, p24: float, p7: float):
-    def pct(a, b):
-        try:
-            return (a - b) / b if b else 0.0
-        except ZeroDivisionError:
-            return 0.0
-    return pct(now, p24), pct(now, p7)
-def price_spike_signal(hist: Dict[str, float], last_n: List[float], cfg: Dict[str, Any]) -> (bool, Dict[str, Any]):
-    p_now = hist.get("now", 0.0)
-    p_24h = hist.get("24h_ago", 0.0)
-    p_7d  = hist.get("7d_ago",  0.0)
-    pct_24h, pct_7d = compute_deltas(p_now, p_24h, p_7d)
-    breakout = False
-    if last_n:
-        breakout = p_now > max(last_n)
-    ok = (pct_24h >= cfg["thresholds"]["pct_24h"] and
-          pct_7d  >= cfg["thresholds"]["pct_7d"] and
-          breakout)
-    return ok, {"pct_24h": pct_24h, "pct_7d": pct_7d, "breakout": breakout}
+
+DAY = 86400.0
+
+def cm_filter(avg1, avg7, avg30, use_trend: bool, min_avg7: float):
+    """Filtros Cardmarket: tendencia avg1 ≥ avg7 ≥ avg30 y avg7 ≥ min_avg7 (si > 0).
+
+    Valores faltantes (None o NaN) cuentan como 0, en la corrida, `score` y el backtest.
+    Acepta escalares o arrays (devuelve bool o array de bool).
+    """
+    a1, a7, a30 = (np.nan_to_num(np.asarray(v, dtype=float)) for v in (avg1, avg7, avg30))
+    ok = np.ones(a7.shape, dtype=bool)
+    if use_trend:
+        ok &= (a1 >= a7) & (a7 >= a30)
+    if min_avg7 and min_avg7 > 0:
+        ok &= a7 >= min_avg7
+    return bool(ok) if ok.ndim == 0 else ok
+
+def score_batch(series: List[tuple], now_prices, now_ts, cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Señales de todo el watchlist en una pasada vectorizada.
+
+    `series[i]` = (timestamps epoch, precios) del historial de la carta i (sin la muestra
+    actual), `now_prices[i]`/`now_ts[i]` la muestra nueva. Los Δ24h/Δ7d se miden contra el
+    último precio registrado en o antes de now-24h / now-7d (o el más antiguo disponible si
+    el historial es más corto); breakout, media/desviación y volatilidad usan la ventana de
+    `breakout_days`.
+    """
+    th = cfg["thresholds"]
+    n = len(series)
+    if n == 0:
+        return []
+    now_p = np.asarray(now_prices, dtype=float)
+    now_t = np.asarray(now_ts, dtype=float)
+    lengths = np.fromiter((len(ts) for ts, _ in series), dtype=np.int64, count=n)
+    ts = np.concatenate([np.asarray(t, dtype=float) for t, _ in series]) if lengths.sum() else np.empty(0)
+    px = np.concatenate([np.asarray(p, dtype=float) for _, p in series]) if lengths.sum() else np.empty(0)
+    card = np.repeat(np.arange(n), lengths)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    has = lengths > 0
+
+    # Clave compuesta (carta, tiempo) ordenada: un searchsorted resuelve los anclajes de todas las cartas.
+    base = min(ts.min(), now_t.min()) if ts.size else now_t.min()
+    span = float(max(ts.max() if ts.size else 0.0, now_t.max()) - base + 1.0)
+    key = card * span + (ts - base)
+    def anchor(seconds):
+        target = np.arange(n) * span + (now_t - seconds - base)
+        idx = np.searchsorted(key, target, side="right") - 1
+        idx = np.where(idx >= starts, idx, starts)  # sin muestra tan antigua → la más antigua
+        return np.where(has, px[np.minimum(idx, max(px.size - 1, 0))] if px.size else now_p, now_p)
+    p_24h, p_7d = anchor(DAY), anchor(7 * DAY)
+
+    # Ventana de breakout_days: máximo, media y desviación por carta.
+    in_win = ts >= (now_t[card] - float(th["breakout_days"]) * DAY) if ts.size else np.zeros(0, bool)
+    roll_max = np.full(n, -np.inf)
+    np.maximum.at(roll_max, card[in_win], px[in_win])
+    cnt = np.bincount(card[in_win], minlength=n).astype(float)
+    s1 = np.bincount(card[in_win], weights=px[in_win], minlength=n)
+    s2 = np.bincount(card[in_win], weights=px[in_win] ** 2, minlength=n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(cnt > 0, s1 / cnt, now_p)
+        std = np.sqrt(np.maximum(np.where(cnt > 1, s2 / cnt - mean ** 2, 0.0), 0.0))
+
+    # Volatilidad: desviación de los retornos entre muestras consecutivas de la misma carta.
+    if ts.size > 1:
+        same = (card[1:] == card[:-1]) & in_win[1:] & in_win[:-1] & (px[:-1] > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ret = np.where(same, px[1:] / np.where(px[:-1] > 0, px[:-1], 1.0) - 1.0, 0.0)
+        rc = np.bincount(card[1:][same], minlength=n).astype(float)
+        r1 = np.bincount(card[1:][same], weights=ret[same], minlength=n)
+        r2 = np.bincount(card[1:][same], weights=ret[same] ** 2, minlength=n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vol = np.sqrt(np.maximum(np.where(rc > 1, r2 / rc - (r1 / np.where(rc > 0, rc, 1)) ** 2, 0.0), 0.0))
+    else:
+        vol = np.zeros(n)
+
+    return score_features(now_p, p_24h, p_7d, np.where(cnt > 0, roll_max, np.nan), mean, std, vol, cfg)
+
+def score_features(now_prices, p_24h, p_7d, rolling_max, mean, std, vol, cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Decisión vectorizada a partir de agregados por carta (del historial o del estado incremental).
+
+    `rolling_max` es NaN si la carta no tiene muestras en la ventana.
+    """
+    th = cfg["thresholds"]
+    now_p, p_24h, p_7d = (np.asarray(x, dtype=float) for x in (now_prices, p_24h, p_7d))
+    roll_max, mean, std, vol = (np.asarray(x, dtype=float) for x in (rolling_max, mean, std, vol))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct_24h = np.where(p_24h > 0, (now_p - p_24h) / p_24h, 0.0)
+        pct_7d = np.where(p_7d > 0, (now_p - p_7d) / p_7d, 0.0)
+        zscore = np.where(std > 0, (now_p - mean) / std, 0.0)
+        vol_spike = np.where(vol > 0, pct_24h / vol, 0.0)
+
+    has_max = np.isfinite(roll_max)
+    breakout = has_max & (now_p > np.where(has_max, roll_max, np.inf))
+    ok = (pct_24h >= th["pct_24h"]) & (pct_7d >= th["pct_7d"]) & breakout
+    # Filtros opcionales: thresholds.zscore_min / thresholds.vol_spike_min.
+    if th.get("zscore_min") is not None:
+        ok &= zscore >= th["zscore_min"]
+    if th.get("vol_spike_min") is not None:
+        ok &= vol_spike >= th["vol_spike_min"]
+
+    out = []
+    for i in range(len(now_p)):
+        out.append({"ok": bool(ok[i]), "pct_24h": float(pct_24h[i]), "pct_7d": float(pct_7d[i]),
+                    "breakout": bool(breakout[i]), "rolling_max": float(roll_max[i]) if has_max[i] else None,
+                    "zscore": float(zscore[i]), "volatility": float(vol[i]), "vol_spike": float(vol_spike[i])})
+    return out
@@ -0,0 +1,199 @@
+import os, csv, glob, sqlite3, threading, datetime as dt
+from array import array
+from .utils import iso_to_epoch, last_csv_ts
+
+DATA_DIR = os.getenv("PK_DATA_DIR") or os.path.join(os.path.dirname(__file__), "..", "data")
+DB_FILE = os.path.join(DATA_DIR, "history.sqlite")
+
+# Clave primaria (card, ts) sin rowid: la tabla queda ordenada por carta y tiempo,
+# así que un rango temporal de una carta es una lectura contigua del índice.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    card TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    price_now REAL,
+    market_now REAL,
+    cm_avg1 REAL,
+    cm_avg7 REAL,
+    cm_avg30 REAL,
+    PRIMARY KEY (card, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS quotes (
+    card TEXT NOT NULL,
+    series TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    price REAL,
+    PRIMARY KEY (card, series, ts)
+) WITHOUT ROWID;
+"""
+# Columnas añadidas después de la primera versión del esquema (se crean si faltan) y su tipo.
+EXTRA_COLUMNS = {"cm_avg1": "REAL", "cm_avg7": "REAL", "cm_avg30": "REAL", "price_source": "TEXT"}
+COLUMNS = ("card", "ts", "price_now", "market_now") + tuple(EXTRA_COLUMNS)
+
+class HistoryStore:
+    """Historial de precios de todas las cartas en un único SQLite (data/history.sqlite).
+
+    `card` es el slug del nombre (el mismo que usaban los CSV) y `ts` el ISO UTC de
+    `now_ts()`, así que las comparaciones de texto equivalen a comparar fechas.
+    """
+    def __init__(self, path: str = DB_FILE, migrate_from: str = None):
+        is_new = not os.path.exists(path)
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        have = {r[1] for r in self.conn.execute("PRAGMA table_info(history)")}
+        for col, kind in EXTRA_COLUMNS.items():
+            if col not in have:
+                self.conn.execute(f"ALTER TABLE history ADD COLUMN {col} {kind}")
+        if is_new and migrate_from:
+            n = self.import_csvs(migrate_from)
+            if n:
+                print(f"[store] migradas {n} filas desde los CSV de {migrate_from}")
+
+    def append_many(self, rows, quotes=()):
+        """rows: iterable de (card, ts, price_now, market_now[, cm_avg1, cm_avg7, cm_avg30, price_source]);
+        quotes: (card, serie, ts, precio) de cada fuente/variante (ver prices.quotes).
+
+        Una sola transacción por llamada para las dos tablas.
+        """
+        rows, quotes = list(rows), list(quotes)
+        if not rows and not quotes:
+            return 0
+        with self._lock, self.conn:
+            if rows:
+                cols = COLUMNS[:len(rows[0])]
+                self.conn.executemany(f"INSERT OR REPLACE INTO history ({', '.join(cols)}) "
+                                      f"VALUES ({', '.join('?' * len(cols))})", rows)
+            if quotes:
+                self.conn.executemany("INSERT OR REPLACE INTO quotes (card, series, ts, price) VALUES (?, ?, ?, ?)",
+                                      quotes)
+        return len(rows)
+
+    def range(self, card: str, since: str = None, until: str = None):
+        """Filas (ts, price_now, market_now) de `card` con since <= ts < until, en orden."""
+        sql = "SELECT ts, price_now, market_now FROM history WHERE card = ?"
+        args = [card]
+        if since:
+            sql += " AND ts >= ?"; args.append(since)
+        if until:
+            sql += " AND ts < ?"; args.append(until)
+        with self._lock:
+            return self.conn.execute(sql + " ORDER BY ts", args).fetchall()
+
+    def tail(self, card: str, n: int = 2):
+        """Últimas `n` filas de `card` (en orden cronológico)."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT ts, price_now, market_now FROM history WHERE card = ? ORDER BY ts DESC LIMIT ?",
+                (card, n)).fetchall()
+        return rows[::-1]
+
+    def price_source(self, card: str):
+        """Serie de la que salió el último price_now de `card` (None en filas anteriores a las series)."""
+        with self._lock:
+            row = self.conn.execute("SELECT price_source FROM history WHERE card = ? ORDER BY ts DESC LIMIT 1",
+                                    (card,)).fetchone()
+        return row[0] if row else None
+
+    def quotes(self, card: str, series: str = None, since: str = None) -> dict:
+        """{serie: [(ts, precio)]} de `card`; `series` filtra por sufijo ("tcgplayer.holofoil.market")."""
+        sql, args = "SELECT series, ts, price FROM quotes WHERE card = ?", [card]
+        if since:
+            sql += " AND ts >= ?"; args.append(since)
+        out = {}
+        with self._lock:
+            for s, ts, p in self.conn.execute(sql + " ORDER BY series, ts", args):
+                if series is None or s.endswith(":" + series):
+                    out.setdefault(s, []).append((ts, p))
+        return out
+
+    def latest_ts(self, card: str):
+        """Timestamp epoch de la última fila de `card` (None si no tiene)."""
+        last = self.tail(card, 1)
+        return iso_to_epoch(last[0][0]) if last else None
+
+    def window(self, card: str, n_days: float, max_rows: int = 1000):
+        """Como utils.load_window: (timestamps epoch, precios) en arrays tipados."""
+        cutoff = (dt.datetime.utcnow() - dt.timedelta(days=n_days)).isoformat()
+        rows = self.range(card, since=cutoff)[-max_rows:]
+        return array("d", (iso_to_epoch(ts) for ts, _, _ in rows)), array("d", (float(p or 0) for _, p, _ in rows))
+
+    def iter_all(self):
+        """(card, ts, price_now, cm_avg1, cm_avg7, cm_avg30) de todo el historial, por carta y tiempo."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT card, ts, price_now, cm_avg1, cm_avg7, cm_avg30 FROM history ORDER BY card, ts").fetchall()
+        return rows
+
+    def last_rows(self) -> dict:
+        """{card: (ts, price_now, cm_avg1, cm_avg7, cm_avg30, price_source)} de la última fila de cada carta."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT h.card, h.ts, h.price_now, h.cm_avg1, h.cm_avg7, h.cm_avg30, h.price_source FROM history h "
+                "JOIN (SELECT card, MAX(ts) AS ts FROM history GROUP BY card) l ON h.card = l.card AND h.ts = l.ts")
+            return {r[0]: r[1:] for r in rows}
+
+    def latest_all(self) -> dict:
+        """{card: último ts ISO} de todas las cartas en una sola consulta."""
+        with self._lock:
+            return dict(self.conn.execute("SELECT card, MAX(ts) FROM history GROUP BY card"))
+
+    def cards(self) -> list:
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT card FROM history ORDER BY card")]
+
+    def import_csvs(self, data_dir: str) -> int:
+        """Importa data/<slug>.csv (formato de append_history_csv). Idempotente."""
+        total = 0
+        for path in sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+            card = os.path.splitext(os.path.basename(path))[0]
+            rows = []
+            with open(path, "r", encoding="utf-8") as f:
+                for r in csv.DictReader(f):
+                    try:
+                        rows.append((card, r["ts"], float(r.get("price_now") or 0), float(r.get("market_now") or 0)))
+                    except (KeyError, TypeError, ValueError):
+                        pass
+            total += self.append_many(rows)
+        return total
+
+    def export_csvs(self, data_dir: str) -> int:
+        """Añade a data/<slug>.csv las filas del store posteriores a la última del CSV.
+
+        Es la copia en texto que se commitea (append, git la comprime bien); si el SQLite
+        se pierde, `open_store` lo reconstruye desde aquí. Sin Cardmarket ni `quotes`.
+        """
+        total = 0
+        for card, latest in self.latest_all().items():
+            path = os.path.join(data_dir, f"{card}.csv")
+            last = last_csv_ts(path)
+            if last is not None and last >= iso_to_epoch(latest):
+                continue
+            since = dt.datetime.utcfromtimestamp(last).isoformat() if last is not None else None
+            rows = [r for r in self.range(card, since=since) if last is None or iso_to_epoch(r[0]) > last]
+            new_file = not os.path.exists(path)
+            with open(path, "a", newline="", encoding="utf-8") as f:
+                w = csv.writer(f)
+                if new_file:
+                    w.writerow(("ts", "price_now", "market_now"))
+                w.writerows(rows)
+            total += len(rows)
+        return total
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+def use_sqlite() -> bool:
+    return os.getenv("HISTORY_BACKEND", "sqlite").lower() == "sqlite"
+
+def open_store(data_dir: str = DATA_DIR) -> HistoryStore:
+    """Abre data/history.sqlite; la primera vez importa los CSV existentes."""
+    return HistoryStore(os.path.join(data_dir, "history.sqlite"), migrate_from=data_dir)
+
+if __name__ == "__main__":
+    # python -m src.store → (re)importa los CSV de data/ al store.
+    store = HistoryStore(DB_FILE)
+    print(f"[store] {store.import_csvs(DATA_DIR)} filas importadas, {len(store.cards())} cartas")
+    store.close()
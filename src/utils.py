@@ -1,5 +1,6 @@
 import os, csv, re, datetime as dt
-from typing import List, Dict, Any
+from array import array
+from typing import List, Dict, Any, Tuple
 def slugify(text: str) -> str:
     text = text.lower()
     text = re.sub(r'[^a-z0-9]+', '-', text)
@@ -15,17 +16,79 @@ def append_history_csv(path: str, row: Dict[str, Any], fieldnames: List[str]):
         if not file_exists:
             writer.writeheader()
         writer.writerow(row)
-def load_last_n(path: str, n_days: int) -> list:
+def iso_to_epoch(ts: str) -> float:
+    return dt.datetime.fromisoformat(ts).replace(tzinfo=dt.timezone.utc).timestamp()
+def _reverse_lines(f, block: int = 8192):
+    """Líneas de un archivo binario desde el final hacia el principio (sin leerlo entero)."""
+    f.seek(0, os.SEEK_END)
+    pos, tail = f.tell(), b""
+    while pos > 0:
+        step = min(block, pos)
+        pos -= step
+        f.seek(pos)
+        chunk = f.read(step) + tail
+        lines = chunk.split(b"\n")
+        tail = lines.pop(0)  # puede estar cortada: se completa con el bloque anterior
+        for line in reversed(lines):
+            yield line
+    if tail:
+        yield tail
+def write_if_changed(path: str, text: str) -> bool:
+    """Escribe sólo si el contenido cambió, para que `git add docs data` no vea archivos tocados de más."""
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            if f.read() == text:
+                return False
+    except OSError:
+        pass
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    return True
+def load_window(path: str, n_days: float, max_rows: int = 1000, column: str = "price_now") -> Tuple[array, array]:
+    """(timestamps epoch, valores de `column`) de las filas con ts dentro de los últimos `n_days`.
+
+    Lee el CSV desde el final y se detiene en la primera fila anterior al corte, así que
+    el coste es O(ventana) y no O(historial). Asume filas en orden cronológico, que es
+    como las escribe append_history_csv.
+    """
+    ts_out, px_out = array("d"), array("d")
     if not os.path.exists(path):
-        return []
-    rows = []
+        return ts_out, px_out
     cutoff = (dt.datetime.utcnow() - dt.timedelta(days=n_days)).isoformat()
-    with open(path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            if r.get('ts','') >= cutoff:
+    with open(path, "rb") as f:
+        header = next(csv.reader([f.readline().decode("utf-8")]), [])
+        if "ts" not in header or column not in header:
+            return ts_out, px_out
+        i_ts, i_px = header.index("ts"), header.index(column)
+        rows = []
+        for raw in _reverse_lines(f):
+            r = raw.decode("utf-8").strip().split(",")
+            if len(r) <= max(i_ts, i_px) or r[i_ts] == "ts":
+                continue  # línea vacía o la cabecera
+            if r[i_ts] < cutoff:
+                break
+            try:
+                rows.append((iso_to_epoch(r[i_ts]), float(r[i_px] or 0)))
+            except ValueError:
+                continue
+            if len(rows) >= max_rows:
+                break
+    for t, p in reversed(rows):
+        ts_out.append(t); px_out.append(p)
+    return ts_out, px_out
+def last_csv_ts(path: str):
+    """Timestamp epoch de la última fila del CSV (None si no hay filas)."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        header = f.readline().decode("utf-8").strip().split(",")
+        if "ts" not in header:
+            return None
+        for raw in _reverse_lines(f):
+            r = raw.decode("utf-8").strip().split(",")
+            if len(r) == len(header) and r[header.index("ts")] != "ts":
                 try:
-                    rows.append(float(r.get('price_now', '0') or 0))
-                except:
-                    pass
-    return rows[-1000:]
+                    return iso_to_epoch(r[header.index("ts")])
+                except ValueError:
+                    return None
+    return None
@@ -0,0 +1,18 @@
+import os
+from src import config
+
+def test_config_cache_only_replaces_its_own_files(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    (cache_dir / "other.json").write_text("{}")
+    monkeypatch.setenv("CONFIG_CACHE", "1")
+    monkeypatch.setenv("CONFIG_CACHE_DIR", str(cache_dir))
+    cfg_file = tmp_path / "config.yaml"
+    cfg_file.write_text("a: 1\n")
+    assert config.load_config(str(cfg_file)) == {"a": 1}
+    first = [f for f in os.listdir(cache_dir) if config.CACHE_NAME.fullmatch(f)]
+    cfg_file.write_text("a: 2\n")
+    assert config.load_config(str(cfg_file)) == {"a": 2}
+    names = sorted(os.listdir(cache_dir))
+    assert "other.json" in names and len(first) == 1 and first[0] not in names
+    assert sum(1 for f in names if config.CACHE_NAME.fullmatch(f)) == 1
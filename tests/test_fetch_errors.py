@@ -0,0 +1,52 @@
+import pytest
+import requests
+from bench.fake_api import FakeAPI
+from src import metrics
+from src.collectors import pokemontcg
+from src.collectors.resolve_cache import ResolveCache
+
+@pytest.fixture
+def html_api(monkeypatch):
+    # Toda respuesta es un 200 con HTML (edge en mantenimiento), sin cache ni límite de ritmo.
+    api = FakeAPI(latency=0, p_html=1.0).start()
+    monkeypatch.setenv("HTTP_CACHE", "0")
+    monkeypatch.setenv("POKEMONTCG_RATE", "1000")
+    monkeypatch.setenv("POKEMONTCG_BURST", "1000")
+    monkeypatch.setattr(pokemontcg, "API_URL", api.url + "/v2/cards")
+    metrics.reset()
+    yield api
+    api.stop()
+
+def test_json_decode_error_is_parse():
+    r = requests.models.Response()
+    r._content, r.status_code = b"<html>maintenance</html>", 200
+    with pytest.raises(requests.exceptions.JSONDecodeError) as exc:
+        r.json()
+    assert metrics.classify_error(exc.value) == "parse"
+    assert metrics.classify_error(requests.exceptions.ConnectionError()) == "net"
+    assert metrics.classify_error(requests.exceptions.ReadTimeout()) == "timeout"
+
+def test_html_body_counts_as_parse_error(html_api):
+    assert pokemontcg.fetch_card_entries(["Benchcard0001 Evolving Skies"], max_cards=2) == []
+    counters = metrics.snapshot()["counters"]
+    parse = {k: v for k, v in counters.items() if k.startswith("fetch.variant.") and k.endswith(".parse")}
+    assert parse and sum(parse.values()) == sum(v for k, v in counters.items() if k.startswith("http.pokemontcg.status.200"))
+    assert not any(k.startswith("fetch.variant.") and k.endswith(".net") for k in counters)
+
+def test_html_body_in_batch_counts_as_parse_error(html_api, tmp_path):
+    cache = ResolveCache(str(tmp_path / "resolve_cache.json"))
+    q = "Benchcard0001 Evolving Skies"
+    cache.put(q, pokemontcg.resolve_fingerprint(q, 2, None), ["evolvingskies-2"])
+    entries, pending = pokemontcg.fetch_watchlist_entries({"Bench": [q]}, cache=cache)
+    counters = metrics.snapshot()["counters"]
+    assert entries == {} and pending == ["Bench"]
+    assert counters.get("fetch.batch.parse") == 1 and "fetch.batch.net" not in counters
+
+def test_failed_batch_counts_resolve_hit_once(html_api, tmp_path):
+    cache = ResolveCache(str(tmp_path / "resolve_cache.json"))
+    q = "Benchcard0001 Evolving Skies"
+    cache.put(q, pokemontcg.resolve_fingerprint(q, 2, None), ["evolvingskies-2"])
+    _, pending = pokemontcg.fetch_watchlist_entries({"Bench": [q]}, cache=cache)
+    assert pending == ["Bench"] and cache.stats()["hits"] == 0
+    pokemontcg.fetch_card_entries([q], max_cards=2, cache=cache)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 0
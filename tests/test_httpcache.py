@@ -0,0 +1,41 @@
+import os
+import requests
+from src.collectors import pokemontcg
+from src.collectors.httpcache import HttpCache
+
+URL = "https://api.example/v2/cards"
+
+def _response(status, body=b"", etag=None):
+    r = requests.models.Response()
+    r.status_code, r._content, r.url = status, body, URL
+    if etag:
+        r.headers["ETag"] = etag
+    return r
+
+class _Session:
+    """Devuelve las respuestas en orden; `on_get` corre antes de cada una."""
+    def __init__(self, responses, on_get=None):
+        self.responses, self.on_get, self.calls = list(responses), on_get, []
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        self.calls.append(dict(headers or {}))
+        if self.on_get:
+            self.on_get()
+        return self.responses.pop(0)
+
+def test_304_with_evicted_body_retries_unconditionally(tmp_path, monkeypatch):
+    cache = HttpCache(str(tmp_path), fresh_sec=0)
+    params = {"q": "name:pikachu"}
+    key = cache.key(URL, params)
+    cache.store(key, _response(200, b'{"data": [1]}', etag='"v1"'))
+    body_f = cache._files(key)[1]
+    # El cuerpo desaparece entre lookup y el 304 (p. ej. otro hilo desaloja).
+    sess = _Session([_response(304), _response(200, b'{"data": [2]}', etag='"v2"')],
+                    on_get=lambda: os.path.exists(body_f) and os.remove(body_f))
+    monkeypatch.setattr(pokemontcg, "get_cache", lambda: cache)
+    monkeypatch.setenv("POKEMONTCG_RATE", "1000")
+    r = pokemontcg._get(sess, pokemontcg._limiter(), URL, {}, params, 5)
+    assert r.status_code == 200 and r.json() == {"data": [2]}
+    assert sess.calls[0].get("If-None-Match") == '"v1"' and "If-None-Match" not in sess.calls[1]
+    meta, _ = cache.lookup(URL, params)
+    assert meta["etag"] == '"v2"'
@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.collectors.setindex import SetIndex
+
+SETS = [{"id": "swsh7", "name": "Evolving Skies", "series": "Sword & Shield", "printedTotal": 203},
+        {"id": "swsh12", "name": "Silver Tempest", "series": "Sword & Shield", "printedTotal": 195}]
+CARDS = {"swsh7": [{"id": "swsh7-215", "name": "Umbreon VMAX", "number": "215", "rarity": "Rare Secret"}],
+         "swsh12": [{"id": "swsh12-186", "name": "Lugia V", "number": "186", "rarity": "Rare Ultra"}]}
+
+class _Fetch:
+    """API falsa: cuenta peticiones y puede frenar las de un set hasta `release`."""
+    def __init__(self, block=None):
+        self.calls, self.block = [], block
+        self.started, self.release = threading.Event(), threading.Event()
+
+    def __call__(self, endpoint, params):
+        if endpoint == "sets":
+            self.calls.append("sets")
+            return {"data": SETS, "totalCount": len(SETS)}
+        sid = params["q"].split('"')[1]
+        self.calls.append(sid)
+        if sid == self.block:
+            self.started.set()
+            assert self.release.wait(5)
+        return {"data": CARDS[sid], "totalCount": len(CARDS[sid])}
+
+def test_concurrent_resolves_download_each_set_once(tmp_path):
+    fetch = _Fetch()
+    index = SetIndex(str(tmp_path / "set_index.json"), fetch)
+    queries = [f"Umbreon VMAX Evolving Skies {i}" for i in range(20)] + [f"Lugia V Silver Tempest {i}" for i in range(20)]
+    with ThreadPoolExecutor(8) as pool:
+        out = list(pool.map(index.resolve, queries))
+    assert [o["numbers"] for o in out] == [["215"]] * 20 + [["186"]] * 20
+    assert sorted(fetch.calls) == ["sets", "swsh12", "swsh7"]
+    assert index.stats()["resolved"] == 40 and index.stats()["refreshed"] == 3
+
+def test_set_download_does_not_block_other_sets(tmp_path):
+    fetch = _Fetch(block="swsh7")
+    index = SetIndex(str(tmp_path / "set_index.json"), fetch)
+    slow = threading.Thread(target=index.resolve, args=("Umbreon VMAX Evolving Skies",))
+    slow.start()
+    assert fetch.started.wait(5)
+    # Mientras swsh7 se baja, otro set se resuelve sin esperar.
+    assert index.resolve("Lugia V Silver Tempest")["numbers"] == ["186"]
+    fetch.release.set()
+    slow.join(5)
+    assert index.resolve("Umbreon VMAX Evolving Skies")["numbers"] == ["215"]
+    assert fetch.calls.count("swsh7") == 1
@@ -0,0 +1,71 @@
+import random
+import numpy as np
+from src.backtest import card_features, run_backtest
+from src.rolling import CardState
+from src.signals import score_batch, cm_filter
+
+DAY = 86400.0
+
+def _series(rnd, n, steps, p_zero=0.0, p_nan=0.0):
+    t, ts, px, cm = 0.0, [], [], []
+    for _ in range(n):
+        t += rnd.choice(steps)
+        ts.append(t)
+        px.append(0.0 if rnd.random() < p_zero else round(rnd.uniform(5, 15), 2))
+        cm.append(tuple(None if rnd.random() < p_nan else round(rnd.uniform(5, 15), 2) for _ in range(3)))
+    return ts, px, cm
+
+def _history(ts, px, cm):
+    arr = lambda k: np.array([np.nan if c[k] is None else c[k] for c in cm], dtype=float)
+    return {"ts": np.array(ts), "price": np.array(px), "avg1": arr(0), "avg7": arr(1), "avg30": arr(2)}
+
+def test_cm_filter_missing_values_count_as_zero():
+    assert cm_filter(None, None, None, True, 0) is True
+    assert cm_filter(5.0, None, None, True, 0) is True
+    assert cm_filter(None, 5.0, None, True, 0) is False
+    assert cm_filter(None, 5.0, None, False, 4.0) is True
+    arr = cm_filter(np.array([np.nan, 5.0]), np.array([np.nan, 6.0]), np.array([np.nan, 1.0]), True, 0)
+    assert arr.tolist() == [True, False]
+
+def test_backtest_features_match_score_batch():
+    rnd = random.Random(3)
+    cfg = {"thresholds": {"pct_24h": 0.0, "pct_7d": 0.0, "breakout_days": 3}}
+    for _ in range(40):
+        ts, px, cm = _series(rnd, rnd.randint(2, 60), [600, 3600, 7200, DAY], p_zero=0.05)
+        f = card_features(_history(ts, px, cm), [3], stats=True)
+        metas = score_batch([(ts[:i], px[:i]) for i in range(1, len(ts))], px[1:], ts[1:], cfg)
+        for i, m in enumerate(metas, 1):
+            assert np.isclose(m["pct_24h"], f["pct_24h"][i])
+            assert np.isclose(m["pct_7d"], f["pct_7d"][i])
+            assert m["breakout"] == bool(f["breakout"][3][i])
+            assert np.isclose(m["zscore"], f["zscore"][3][i], rtol=1e-6, atol=1e-6)
+            assert np.isclose(m["vol_spike"], f["vol_spike"][3][i], rtol=1e-6, atol=1e-6)
+
+def test_backtest_counts_match_per_sample_decision():
+    rnd = random.Random(5)
+    th = {"pct_24h": 0.05, "pct_7d": 0.1, "breakout_days": 3, "zscore_min": 0.5, "vol_spike_min": 0.2}
+    history, expected = {}, 0
+    for c in range(6):
+        ts, px, cm = _series(rnd, 80, [3600, 8 * 3600, DAY], p_nan=0.3)
+        history[f"card{c}"] = _history(ts, px, cm)
+        metas = score_batch([(ts[:i], px[:i]) for i in range(len(ts))], px, ts, {"thresholds": th})
+        for m, p, (a1, a7, a30) in zip(metas, px, cm):
+            has_cm = any(v is not None for v in (a1, a7, a30))
+            expected += m["ok"] and p > 0 and has_cm and cm_filter(a1, a7, a30, True, 8.0)
+    grid = {"pct_24h": [th["pct_24h"]], "pct_7d": [th["pct_7d"]], "breakout_days": [3], "min_avg7": [8.0],
+            "trend": [True], "zscore_min": th["zscore_min"], "vol_spike_min": th["vol_spike_min"]}
+    res = run_backtest(history, grid, workers=1)
+    assert expected > 0
+    assert res["results"][0]["alerts"] == expected
+
+def test_card_state_anchors_match_score_batch():
+    rnd = random.Random(7)
+    cfg = {"thresholds": {"pct_24h": 0.05, "pct_7d": 0.1, "breakout_days": 5}}
+    for _ in range(200):
+        ts, px, _ = _series(rnd, rnd.randint(1, 200), [3600, 7200, 8 * 3600, DAY])
+        now, p = ts[-1] + rnd.choice([3600, 8 * 3600, DAY]), rnd.uniform(5, 18)
+        f = CardState.rebuild(ts, px, 5, 3, gap_sec=3600).features(now, p)
+        m = score_batch([(ts, px)], [p], [now], cfg)[0]
+        assert np.isclose((p - f["p_24h"]) / f["p_24h"], m["pct_24h"])
+        assert np.isclose((p - f["p_7d"]) / f["p_7d"], m["pct_7d"])
+        assert (p > f["rolling_max"]) == m["breakout"]